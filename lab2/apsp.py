@@ -0,0 +1,213 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# All pairs hop counts of big graphs (e.g. switches of k = 48 fat tree or jellyfish) computed by a pool of processes
+# into one uint8 matrix - one byte per pair of nodes, UNREACHABLE for pairs without a path. The matrix lives in
+# shared memory (or in a np.memmap file when path is given), sources are split into shards of consecutive rows and
+# every worker writes rows of its shard straight into the matrix with bitset BFS, so nothing is sent back.
+# Analyses get the matrix itself (distances.matrix), no copies are made.
+#
+#   with apsp.all_pairs(topology.to_csr()) as distances:
+#       histogram = apsp.histogram(distances.matrix, topology.servers_per_switch())
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import os
+import numpy as np
+
+import topo
+
+UNREACHABLE = 255
+
+
+# attaching shared memory created by another process, it is removed only by its creator
+# before python 3.13 the block is registered again, which is harmless as workers share the resource tracker of
+# the creator (it is running since the block was created)
+def attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# num_nodes x num_nodes uint8 matrix in shared memory, or in a file when path is given
+# the creator removes the shared memory on close, other processes open the same matrix by its location()
+# views of matrix have to be dropped before close (shared memory can not be closed while they exist)
+class DistanceMatrix:
+    def __init__(self, num_nodes, path=None, name=None, create=True):
+        self.num_nodes = num_nodes
+        self.path = path
+        self.created = create
+        self.memory = None
+        shape = (num_nodes, num_nodes)
+        if path is not None:
+            self.matrix = np.memmap(path, dtype=np.uint8, mode='w+' if create else 'r+', shape=shape)
+        else:
+            # shared memory can not be empty
+            size = max(num_nodes * num_nodes, 1)
+            self.memory = shared_memory.SharedMemory(create=True, size=size) if create else attach(name)
+            self.matrix = np.ndarray(shape, dtype=np.uint8, buffer=self.memory.buf)
+        self.name = self.memory.name if self.memory is not None else None
+
+    # what another process needs to open the same matrix
+    def location(self):
+        return self.num_nodes, self.path, self.name
+
+    @classmethod
+    def open(cls, num_nodes, path=None, name=None):
+        return cls(num_nodes, path, name, create=False)
+
+    def flush(self):
+        if self.path is not None:
+            self.matrix.flush()
+
+    def close(self):
+        if self.matrix is None:
+            return
+        self.flush()
+        self.matrix = None
+        if self.memory is not None:
+            self.memory.close()
+            if self.created:
+                self.memory.unlink()
+            self.memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# read only matrix saved by all_pairs with a path, without loading it into memory
+def load(path):
+    num_nodes = int(round(os.path.getsize(path) ** 0.5))
+    return np.memmap(path, dtype=np.uint8, mode='r', shape=(num_nodes, num_nodes))
+
+
+# hop counts from the sources written into rows (uint8 array of shape (len(sources), num_nodes))
+def fill_rows(csr, sources, rows):
+    rows[:] = UNREACHABLE
+    for level, new in topo.bitset_bfs(csr, sources):
+        if level >= UNREACHABLE:
+            raise ValueError('hop counts from %d do not fit into uint8' % UNREACHABLE)
+        bits = np.unpackbits(new.view(np.uint8), axis=1, bitorder='little')[:, :len(sources)]
+        node_idx, source_idx = np.nonzero(bits)
+        rows[source_idx, node_idx] = level
+
+
+# shards of consecutive sources (start, end), shard_size is rounded up to whole words of the BFS bitsets
+def source_shards(num_nodes, shard_size):
+    shard_size = max(64, -(-shard_size // 64) * 64)
+    return [(start, min(start + shard_size, num_nodes)) for start in range(0, num_nodes, shard_size)]
+
+
+# each worker gets the graph and opens the matrix once
+worker_csr = None
+worker_distances = None
+
+
+def init_worker(csr, location):
+    global worker_csr, worker_distances
+    worker_csr = csr
+    worker_distances = DistanceMatrix.open(*location)
+
+
+def fill_shard(shard):
+    start, end = shard
+    fill_rows(worker_csr, np.arange(start, end), worker_distances.matrix[start:end])
+    worker_distances.flush()
+    return end - start
+
+
+# hop counts between all pairs of nodes of the CSR graph as DistanceMatrix (close it when done, or use it in with)
+# processes=1 computes in this process, otherwise sources are sharded over a pool (default - all cores), by
+# default there are about 4 shards per process, so the work stays balanced
+def all_pairs(csr, processes=None, path=None, shard_size=None):
+    processes = processes or mp.cpu_count()
+    if shard_size is None:
+        shard_size = -(-csr.num_nodes // (4 * processes))
+    distances = DistanceMatrix(csr.num_nodes, path)
+    try:
+        shards = source_shards(csr.num_nodes, shard_size)
+        if processes == 1:
+            for start, end in shards:
+                fill_rows(csr, np.arange(start, end), distances.matrix[start:end])
+        else:
+            with mp.Pool(processes, initializer=init_worker, initargs=(csr, distances.location())) as pool:
+                for _ in pool.imap_unordered(fill_shard, shards):
+                    pass
+        distances.flush()
+    except BaseException:
+        distances.close()
+        raise
+    return distances
+
+
+# histogram of path lengths from the matrix, read in blocks of rows. Without hosts it counts unordered pairs of
+# nodes by hop count. With hosts (number of servers of every node) it counts unordered pairs of servers by path
+# length with the server links (same format as topo.path_length_histogram). Unreachable pairs are left out.
+def histogram(matrix, hosts=None, block=1024):
+    num_nodes = len(matrix)
+    counts = np.zeros(UNREACHABLE + 1, dtype=np.float64)
+    if hosts is not None:
+        hosts = np.asarray(hosts, dtype=np.int64)
+    for start in range(0, num_nodes, block):
+        rows = matrix[start:start + block]
+        weights = None if hosts is None else np.outer(hosts[start:start + block], hosts).ravel()
+        counts += np.bincount(rows.ravel(), weights, minlength=UNREACHABLE + 1)
+    # every pair is counted from both sides, node to itself has distance 0
+    counts = np.round(counts[:UNREACHABLE] / 2).astype(np.int64)
+    counts[0] = 0
+    reached = np.flatnonzero(counts)
+    max_level = int(reached[-1]) if len(reached) else 0
+    if hosts is None:
+        return counts[:max_level + 1]
+    result = np.zeros(max_level + 3, dtype=np.int64)
+    result[3:] = counts[1:max_level + 1]
+    # pairs of servers sharing the switch - path server -> switch -> server
+    result[2] = int((hosts * (hosts - 1) // 2).sum())
+    return result
+
+
+# longest hop count among the reachable pairs
+def diameter(matrix, block=1024):
+    result = 0
+    for start in range(0, len(matrix), block):
+        rows = matrix[start:start + block]
+        result = max(result, int(rows[rows != UNREACHABLE].max(initial=0)))
+    return result
+
+
+if __name__ == "__main__":
+    import time
+
+    # switch graphs of k = 48 fat tree and jellyfish built from the same equipment
+    num_ports = 48
+    num_servers = int((num_ports ** 3) / 4)
+    num_switches = int(num_ports * num_ports * 5 / 4)
+    topologies = {
+        'fattree': topo.Fattree(num_ports),
+        'jellyfish': topo.Jellyfish(num_servers, num_switches, num_ports, seed=0),
+    }
+    for name, topology in topologies.items():
+        csr = topology.to_csr()
+        start = time.time()
+        with all_pairs(csr) as distances:
+            elapsed = time.time() - start
+            print('%s: %d switches, %.1f MB matrix, %.2f s on %d processes, diameter %d' % (
+                name, csr.num_nodes, distances.matrix.nbytes / 2 ** 20, elapsed, mp.cpu_count(),
+                diameter(distances.matrix)))
+            print('  server path lengths: ' + str(histogram(distances.matrix, topology.servers_per_switch())))
@@ -0,0 +1,236 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Benchmarks of topology generation, path computations and the reproduce pipelines over a grid of parameters.
+# Every case runs in its own (forked) process, so peak RSS of one case is not hidden by the cases before it. Peak
+# RSS is counted from the RSS of the process before setup, so the modules inherited from this process (numpy,
+# matplotlib, ...) do not hide growth of small cases. The case is timed first (best of a few repeats) and then
+# run once more under tracemalloc for the peak of the allocated memory. Results are written to a JSON file and can
+# be compared with a stored baseline, cases slower (or bigger) than the baseline by more than the threshold are
+# reported and the script exits with status 1, as it does when a case fails.
+#
+#   python benchmark.py --output results.json                  # run all cases
+#   python benchmark.py --quick --baseline baseline.json       # small grid, compare with the baseline
+#   python benchmark.py --output baseline.json --only jellyfish # only cases whose name contains 'jellyfish'
+
+import argparse
+import json
+import multiprocessing as mp
+import platform
+import queue as queue_module
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+import apsp
+import topo
+import traffic
+import reproduce_1c
+import reproduce_9
+
+
+# params of the jellyfish built from the same equipment as fat tree with k ports
+def jellyfish_params(num_ports):
+    return int((num_ports ** 3) / 4), int(num_ports * num_ports * 5 / 4), num_ports
+
+
+def jellyfish(num_ports):
+    return topo.Jellyfish(*jellyfish_params(num_ports), seed=0)
+
+
+# random switch pairs of the jellyfish for the path computations
+def switch_pairs(topology, num_pairs, seed=0):
+    src, dst = traffic.random_permutation(len(topology.servers), seed)
+    pairs, _ = traffic.switch_demands(src, dst, topology.server_switches())
+    return pairs[:num_pairs]
+
+
+def ksp_setup(num_ports, k, num_pairs=20):
+    topology = jellyfish(num_ports)
+    return topology.to_csr(), switch_pairs(topology, num_pairs).tolist(), k
+
+
+def ksp_run(state):
+    csr, pairs, k = state
+    for source, target in pairs:
+        topo.ksp_yen_csr(csr, source, target, k)
+
+
+def ksp_from_source_run(state):
+    csr, pairs, k = state
+    trees = {}
+    targets = {}
+    for source, target in pairs:
+        targets.setdefault(source, []).append(target)
+    for source, source_targets in targets.items():
+        topo.ksp_from_source(csr, source, source_targets, k, trees)
+
+
+def dijkstra_setup(num_ports):
+    topology = jellyfish(num_ports)
+    return topology.switches[0], topology.switches
+
+
+def reproduce_9_setup(num_ports, num_pairs):
+    topology = jellyfish(num_ports)
+    return topology.to_csr(), switch_pairs(topology, num_pairs)
+
+
+# benchmark cases: (name, params of the grid, setup(params) -> state, run(state)), setup is not measured
+# quick is the part of the grid used with --quick
+CASES = [
+    ('fattree_generate', [(8,), (14,), (24,)], lambda k: k, topo.Fattree),
+    ('jellyfish_generate', [(8,), (14,), (24,)], jellyfish_params,
+     lambda params: topo.Jellyfish(*params, seed=0)),
+    ('dijkstra_nodes', [(8,), (14,)], dijkstra_setup, lambda state: topo.dijkstra(*state)),
+    ('bfs_csr', [(14,), (24,)], lambda k: jellyfish(k).to_csr(),
+     lambda csr: [topo.bfs(csr, source) for source in range(0, csr.num_nodes, 10)]),
+    ('apsp_fattree', [(14,), (24,)], lambda k: topo.Fattree(k).to_csr(), topo.all_pairs_hops),
+    ('apsp_jellyfish', [(14,), (24,)], lambda k: jellyfish(k).to_csr(), topo.all_pairs_hops),
+    ('apsp_uint8_jellyfish', [(24,), (48,)], lambda k: jellyfish(k).to_csr(),
+     lambda csr: apsp.all_pairs(csr, processes=1).close()),
+    ('ksp_yen', [(14, 1), (14, 8), (14, 16)], ksp_setup, ksp_run),
+    ('ksp_from_source', [(14, 8), (14, 16)], lambda num_ports, k: ksp_setup(num_ports, k, 100),
+     ksp_from_source_run),
+    ('reproduce_1c_fattree', [(14,), (24,)], lambda k: topo.Fattree(k), reproduce_1c.path_length_distribution),
+    ('reproduce_1c_jellyfish', [(14,), (24,)], jellyfish, reproduce_1c.path_length_distribution),
+    ('reproduce_9', [(14, 200)], reproduce_9_setup, lambda state: reproduce_9.run_parallel(*state, processes=1)),
+]
+QUICK = {'fattree_generate': 2, 'jellyfish_generate': 2, 'dijkstra_nodes': 1, 'bfs_csr': 1, 'apsp_fattree': 1,
+         'apsp_jellyfish': 1, 'apsp_uint8_jellyfish': 1, 'ksp_yen': 2, 'ksp_from_source': 1, 'reproduce_1c_fattree': 1,
+         'reproduce_1c_jellyfish': 1, 'reproduce_9': 1}
+
+
+# key of a case in the results file, e.g. 'ksp_yen[14,8]'
+def case_key(name, params):
+    return name + '[' + ','.join(str(param) for param in params) + ']'
+
+
+# ru_maxrss is in kilobytes on linux and in bytes on mac
+def max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+# measuring one case, executed in the child process, the results (or {'error': ...} when the case raised) are put
+# into the queue
+def measure(setup, run, params, repeats, queue):
+    try:
+        rss_before = max_rss()
+        state = setup(*params)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        queue.put({'time': min(times), 'times': times, 'peak_rss': max_rss() - rss_before, 'alloc_peak': peak})
+    except Exception as exc:
+        queue.put({'error': repr(exc)})
+
+
+# the child can also die without putting anything into the queue (killed by the OOM killer, segfault), so the queue
+# is polled while the child is alive. Returns {'error': ...} for a failed case.
+def run_case(params, setup, run, repeats=3, poll=1.0):
+    context = mp.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(setup, run, params, repeats, queue))
+    process.start()
+    while True:
+        try:
+            result = queue.get(timeout=poll)
+            break
+        except queue_module.Empty:
+            if not process.is_alive():
+                # the result may have been put into the queue right before the child exited
+                try:
+                    result = queue.get(timeout=poll)
+                except queue_module.Empty:
+                    result = {'error': 'process died with exit code %s' % process.exitcode}
+                break
+    process.join()
+    return result
+
+
+def run_benchmarks(quick=False, only=None, repeats=3):
+    results = {}
+    for name, grid, setup, run in CASES:
+        if only and only not in name:
+            continue
+        for params in grid[:QUICK[name]] if quick else grid:
+            key = case_key(name, params)
+            results[key] = run_case(params, setup, run, repeats)
+            if 'error' in results[key]:
+                print('%-32s FAILED %s' % (key, results[key]['error']))
+                continue
+            print('%-32s %9.3f s %9.1f MB rss %9.1f MB allocated' % (
+                key, results[key]['time'], results[key]['peak_rss'] / 2 ** 20, results[key]['alloc_peak'] / 2 ** 20))
+    return results
+
+
+# cases of the results that are worse than in the baseline by more than the thresholds (ratios), cases missing
+# in the baseline and failed cases (in either) are skipped. Returns list of (key, metric, baseline value, new value).
+def compare(results, baseline, time_threshold=1.25, memory_threshold=1.25, min_time=0.01, min_memory=2 ** 20):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline or 'error' in result or 'error' in baseline[key]:
+            continue
+        old = baseline[key]
+        # very short cases are mostly noise
+        if max(old['time'], result['time']) >= min_time and result['time'] > time_threshold * old['time']:
+            regressions.append((key, 'time', old['time'], result['time']))
+        for metric in ('peak_rss', 'alloc_peak'):
+            # and so is memory below a megabyte (allocator pages)
+            if max(old[metric], result[metric]) >= min_memory and result[metric] > memory_threshold * old[metric]:
+                regressions.append((key, metric, old[metric], result[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks of the topology code')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file the results are written to')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare with')
+    parser.add_argument('--quick', action='store_true', help='run only the small part of the parameter grid')
+    parser.add_argument('--only', default=None, help='run only cases whose name contains this string')
+    parser.add_argument('--repeats', type=int, default=3, help='timed runs of every case (the best one counts)')
+    parser.add_argument('--time-threshold', type=float, default=1.25, help='allowed ratio of time to the baseline')
+    parser.add_argument('--memory-threshold', type=float, default=1.25,
+                        help='allowed ratio of peak RSS and allocated memory to the baseline')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.quick, args.only, args.repeats)
+    with open(args.output, 'w') as file:
+        json.dump({'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                   'results': results}, file, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+        for key, metric, old, new in regressions:
+            print('REGRESSION %s %s: %.4g -> %.4g (x%.2f)' % (key, metric, old, new, new / old))
+        if not regressions:
+            print('no regressions against ' + args.baseline)
+
+    failed = [key for key, result in results.items() if 'error' in result]
+    if failed:
+        print('%d failed cases: %s' % (len(failed), ', '.join(failed)))
+    if failed or args.baseline and regressions:
+        sys.exit(1)
@@ -0,0 +1,180 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Statistics of random jellyfish topologies over an ensemble of seeded instances. Each worker process generates
+# one instance, runs the metric on it and sends back only the (small) result, so instances are never held in
+# memory together. Results are streamed back as they finish and folded into running mean and variance (Welford),
+# so the summary with confidence intervals is available after every instance and memory does not grow with the
+# number of instances.
+#
+#   summary = ensemble.run((686, 245, 14), 'throughput', 30, routing='ksp')
+#   summary['normalized']['mean'], summary['normalized']['ci']
+
+import multiprocessing as mp
+from statistics import NormalDist
+import numpy as np
+
+import apsp
+import topo
+import traffic
+import throughput
+
+
+# fractions of server pairs with each path length (index is the length in hops, server links included)
+def path_lengths(topology, seed, **options):
+    histogram = topo.path_length_histogram(topology.to_csr(), topology.servers_per_switch())
+    return {'fractions': histogram / max(int(histogram.sum()), 1)}
+
+
+# longest and mean hop count between switches
+def diameter(topology, seed, **options):
+    with apsp.all_pairs(topology.to_csr(), processes=1) as distances:
+        switch_pairs = apsp.histogram(distances.matrix)
+        return {'diameter': apsp.diameter(distances.matrix),
+                'mean_hops': float((switch_pairs * np.arange(len(switch_pairs))).sum() / max(switch_pairs.sum(), 1))}
+
+
+# number of equal cost (shortest) paths between switches of a random permutation traffic matrix, counts are capped
+# at max_paths (what ECMP of that width can use)
+def ecmp_diversity(topology, seed, max_paths=64, **options):
+    src, dst = traffic.random_permutation(len(topology.servers), seed)
+    pairs, _ = traffic.switch_demands(src, dst, topology.server_switches())
+    csr = topology.to_csr()
+    counts = []
+    order = np.argsort(pairs[:, 0], kind='stable')
+    sources, starts = np.unique(pairs[order, 0], return_index=True)
+    for source, group in zip(sources.tolist(), np.split(order, starts[1:])):
+        counts.append(topo.ShortestPathDAG(csr, source).counts[pairs[group, 1]])
+    counts = np.minimum(np.concatenate(counts), max_paths) if counts else np.zeros(0, dtype=np.int64)
+    return {
+        'mean_paths': float(counts.mean()) if len(counts) else 0.0,
+        'single_path_fraction': float((counts == 1).mean()) if len(counts) else 0.0,
+        'fraction_8_paths': float((counts >= 8).mean()) if len(counts) else 0.0,
+    }
+
+
+# max-min fair throughput of a random permutation traffic matrix (see throughput.evaluate), the minimum is also
+# normalized by the server link capacity
+def throughput_metric(topology, seed, routing='ksp', num_paths=8, **options):
+    src, dst = traffic.random_permutation(len(topology.servers), seed)
+    result = throughput.evaluate_topology(topology, src, dst, routing, num_paths, seed=seed, **options)
+    server_capacity = options.get('server_capacity') or topology.server_capacity()
+    return {'normalized': result['normalized'], 'min': result['min'] / server_capacity}
+
+
+# metric(topology, seed, **options) -> dict of numbers or arrays
+METRICS = {
+    'path_lengths': path_lengths,
+    'diameter': diameter,
+    'ecmp': ecmp_diversity,
+    'throughput': throughput_metric,
+}
+
+
+# running mean and variance of numbers or arrays (Welford). Arrays may differ in length, the missing entries of
+# the shorter ones count as zeros (e.g. histograms of topologies with smaller diameter).
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.scalar = True
+
+    def add(self, value):
+        self.scalar = self.scalar and np.ndim(value) == 0
+        value = np.atleast_1d(np.asarray(value, dtype=np.float64))
+        if len(value) > len(self.mean):
+            self.mean = np.concatenate((self.mean, np.zeros(len(value) - len(self.mean))))
+            self.m2 = np.concatenate((self.m2, np.zeros(len(value) - len(self.m2))))
+        elif len(value) < len(self.mean):
+            value = np.concatenate((value, np.zeros(len(self.mean) - len(value))))
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    # sample standard deviation
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.zeros_like(self.mean)
+
+    # half width of the confidence interval of the mean (normal approximation)
+    def interval(self, confidence=0.95):
+        if self.count < 2:
+            return np.full_like(self.mean, np.inf)
+        z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        return z * self.std() / np.sqrt(self.count)
+
+    # dict with mean, std, ci (half width) and count, numbers for scalar values and arrays otherwise
+    def summary(self, confidence=0.95):
+        values = {'mean': self.mean, 'std': self.std(), 'ci': self.interval(confidence)}
+        if self.scalar:
+            values = {name: float(value[0]) for name, value in values.items()}
+        values['count'] = self.count
+        return values
+
+
+# executed in the worker, the instance is generated, measured and dropped
+def evaluate_instance(task):
+    params, seed, metric, options = task
+    topology = topo.Jellyfish(*params, seed=seed)
+    return seed, METRICS[metric](topology, seed, **options)
+
+
+# generator of (seed, result) of the metric for num_instances jellyfish instances with params (num_servers,
+# num_switches, num_ports) and seeds seed, seed + 1, ..., in order of completion. Every process works on one
+# instance at a time, processes=1 runs everything in this process.
+def instance_results(params, metric, num_instances, seed=0, processes=None, **options):
+    if metric not in METRICS:
+        raise ValueError('unknown metric: ' + str(metric))
+    tasks = ((tuple(params), seed + run, metric, options) for run in range(num_instances))
+    processes = processes or mp.cpu_count()
+    if processes == 1:
+        for task in tasks:
+            yield evaluate_instance(task)
+        return
+    with mp.Pool(processes) as pool:
+        for result in pool.imap_unordered(evaluate_instance, tasks):
+            yield result
+
+
+# summary (dict name -> RunningStats.summary) of the metric over the ensemble, callback(seed, result, stats) is
+# called after every instance with the stats so far (e.g. to print progress), when it returns True the remaining
+# instances are skipped (e.g. when intervals are narrow enough)
+def run(params, metric, num_instances, seed=0, processes=None, confidence=0.95, callback=None, **options):
+    stats = {}
+    for instance_seed, result in instance_results(params, metric, num_instances, seed, processes, **options):
+        for name, value in result.items():
+            stats.setdefault(name, RunningStats()).add(value)
+        if callback is not None and callback(instance_seed, result, stats):
+            break
+    return {name: value.summary(confidence) for name, value in stats.items()}
+
+
+if __name__ == "__main__":
+    import time
+
+    # jellyfish built from the same equipment as fat tree with k = 14
+    num_ports = 14
+    params = (int((num_ports ** 3) / 4), int(num_ports * num_ports * 5 / 4), num_ports)
+    num_instances = 20
+    for metric in METRICS:
+        start = time.time()
+        summary = run(params, metric, num_instances)
+        print('%s over %d instances (%.1f s)' % (metric, num_instances, time.time() - start))
+        for name, values in summary.items():
+            if np.ndim(values['mean']):
+                print('  %s: %s +- %s' % (name, np.round(values['mean'], 4), np.round(values['ci'], 4)))
+            else:
+                print('  %s: %.4f +- %.4f' % (name, values['mean'], values['ci']))
@@ -0,0 +1,147 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Resilience of a topology to random failures of links or switches. The all pairs distances of the intact switch
+# graph are computed once, every failure scenario only marks the failed links as banned (the graph is never
+# modified) and repairs the distances: failures can only make paths longer, and distances from a source stay the
+# same unless some node lost all links to its parents (neighbors one hop closer to the source), so only those
+# sources are searched again, with bitset BFS that skips the banned links.
+
+import numpy as np
+
+import topo
+
+MODES = ('link', 'switch')
+
+
+# bool mask of links (by link id) that go down together with the failed switches
+def switch_links(csr, switches):
+    failed = np.zeros(csr.num_nodes, dtype=bool)
+    failed[switches] = True
+    return failed[csr.links[:, 0]] | failed[csr.links[:, 1]]
+
+
+# sources whose distances change when the banned links fail, distances are the hop counts of the intact graph
+# (matrix over all nodes), a node of a failed link is checked for a parent over the links that are still up
+# failed switches (bool mask, all their links banned) are left out, distances from and to them are not needed
+def affected_sources(csr, distances, banned_links, failed=None):
+    affected = np.zeros(csr.num_nodes, dtype=bool)
+    failed_links = np.flatnonzero(banned_links)
+    if not len(failed_links):
+        return affected
+    up = ~banned_links[csr.link_of]
+    nodes = np.unique(csr.links[failed_links])
+    if failed is not None:
+        nodes = nodes[~failed[nodes]]
+    for node in nodes.tolist():
+        arcs = np.arange(csr.offsets[node], csr.offsets[node + 1])
+        neighbors = csr.targets[arcs[up[arcs]]]
+        parents = (distances[:, neighbors] == distances[:, [node]] - 1).sum(axis=1)
+        affected |= (distances[:, node] > 0) & (parents == 0)
+    if failed is not None:
+        affected &= ~failed
+    return affected
+
+
+# distances after the banned links fail, rows of the affected sources are searched again (returns the distances
+# and number of searched sources), distances of the intact graph are not modified
+def repair_distances(csr, distances, banned_links, failed=None):
+    affected = np.flatnonzero(affected_sources(csr, distances, banned_links, failed))
+    repaired = distances.copy()
+    if len(affected):
+        rows = topo.multi_source_hops(csr, affected, banned_links)
+        # the graph is undirected, so columns of the affected sources change the same way
+        repaired[affected] = rows
+        repaired[:, affected] = rows.T
+    return repaired, len(affected)
+
+
+# metrics of one scenario over switches that are still up (alive), hosts[v] is the number of servers of switch v
+# diameter is the longest switch to switch path (in hops) among the connected pairs, mean path length is over
+# connected pairs of servers on different switches (server links included) and disconnected pairs are server pairs
+def scenario_metrics(distances, hosts, alive):
+    alive = np.flatnonzero(alive)
+    matrix = distances[np.ix_(alive, alive)]
+    weights = np.outer(hosts[alive], hosts[alive]).astype(np.float64)
+    np.fill_diagonal(weights, 0)
+    connected = matrix >= 0
+    connected_weight = weights[connected].sum()
+    return {
+        'diameter': int(matrix.max(initial=0)),
+        'mean_path_length': float((weights[connected] * (matrix[connected] + 2)).sum() / connected_weight)
+        if connected_weight else 0.0,
+        'disconnected_pairs': int(weights[~connected].sum() // 2),
+    }
+
+
+# random failure scenarios of the switch graph, for every failure rate num_scenarios scenarios where the given
+# fraction of links (mode 'link') or switches (mode 'switch', with all their links and servers) fails
+# Returns dict rate -> dict of arrays with the metrics of each scenario and number of sources searched again.
+def analyze(csr, hosts, rates, num_scenarios=100, mode='link', seed=None, distances=None):
+    if mode not in MODES:
+        raise ValueError('unknown failure mode: ' + str(mode))
+    hosts = np.asarray(hosts, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    if distances is None:
+        distances = topo.all_pairs_hops(csr)
+
+    results = {}
+    for rate in rates:
+        metrics = {'diameter': [], 'mean_path_length': [], 'disconnected_pairs': [], 'recomputed': []}
+        for _ in range(num_scenarios):
+            alive = np.ones(csr.num_nodes, dtype=bool)
+            if mode == 'link':
+                banned_links = np.zeros(csr.num_links, dtype=bool)
+                banned_links[rng.choice(csr.num_links, int(round(rate * csr.num_links)), replace=False)] = True
+            else:
+                failed = rng.choice(csr.num_nodes, int(round(rate * csr.num_nodes)), replace=False)
+                alive[failed] = False
+                banned_links = switch_links(csr, failed)
+            repaired, recomputed = repair_distances(csr, distances, banned_links, ~alive)
+            for name, value in scenario_metrics(repaired, hosts, alive).items():
+                metrics[name].append(value)
+            metrics['recomputed'].append(recomputed)
+        results[rate] = {name: np.array(values) for name, values in metrics.items()}
+    return results
+
+
+# failure analysis of the switch graph of the topology object
+def analyze_topology(topology, rates, num_scenarios=100, mode='link', seed=None):
+    return analyze(topology.to_csr(), topology.servers_per_switch(), rates, num_scenarios, mode, seed)
+
+
+if __name__ == "__main__":
+    import time
+    import store
+
+    # fat tree and jellyfish built from the same equipment (k = 14)
+    num_ports = 14
+    num_servers = int((num_ports ** 3) / 4)
+    num_switches = int(num_ports * num_ports * 5 / 4)
+    topologies = {
+        'fattree': store.load_topology('fattree', (num_ports,)),
+        'jellyfish': store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0),
+    }
+    rates = (0.01, 0.05, 0.1, 0.2)
+    for mode in MODES:
+        for name, topology in topologies.items():
+            start = time.time()
+            results = analyze_topology(topology, rates, 500, mode, seed=0)
+            print('%s failures of %s (%.1f s)' % (mode, name, time.time() - start))
+            for rate, metrics in results.items():
+                print('  %4.0f%%: diameter %.2f, mean path length %.3f, disconnected server pairs %.1f, '
+                      'sources searched %.1f' % (100 * rate, metrics['diameter'].mean(),
+                                                 metrics['mean_path_length'].mean(),
+                                                 metrics['disconnected_pairs'].mean(), metrics['recomputed'].mean()))
@@ -0,0 +1,104 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Checkpointed runner for long experiments. The work items (e.g. switch pairs) are split into a fixed number of
+# deterministic shards and the result of each shard (array of counts) is saved to its own file as soon as it is
+# done. A restarted run skips the shards that are already on disk, and shards can be given to different machines
+# by index - copying the files into one job directory and merging them gives the same result as a single run.
+
+import hashlib
+import json
+import os
+import numpy as np
+
+import store
+
+DEFAULT_DIRECTORY = 'jobs'
+
+
+# content address of the job, any change of its description (topology, items, number of shards) makes a new job
+def job_key(name, description):
+    description = json.dumps([store.STORE_VERSION, name, description], sort_keys=True)
+    return name + '-' + hashlib.sha1(description.encode()).hexdigest()[:16]
+
+
+def job_directory(name, description, directory=DEFAULT_DIRECTORY):
+    return os.path.join(directory, job_key(name, description))
+
+
+def shard_path(job_dir, index, num_shards):
+    return os.path.join(job_dir, 'shard-%05d-of-%05d.npz' % (index, num_shards))
+
+
+# slice of items that belongs to the shard, shards are contiguous and differ in size by at most one item
+def shard_bounds(num_items, num_shards, index):
+    if not 0 <= index < num_shards:
+        raise ValueError('shard index %d out of range for %d shards' % (index, num_shards))
+    size, rest = divmod(num_items, num_shards)
+    start = index * size + min(index, rest)
+    return start, start + size + (1 if index < rest else 0)
+
+
+def completed_shards(job_dir, num_shards):
+    return [index for index in range(num_shards) if os.path.exists(shard_path(job_dir, index, num_shards))]
+
+
+# shards are given as comma separated indices and ranges, e.g. '0-3,7', empty or None means all shards
+def parse_shards(text, num_shards):
+    if not text:
+        return list(range(num_shards))
+    indices = set()
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        first, last = int(first), int(last or first)
+        if last < first:
+            raise ValueError('reversed shard range: ' + part)
+        indices.update(range(first, last + 1))
+    for index in indices:
+        shard_bounds(0, num_shards, index)
+    return sorted(indices)
+
+
+# running the work function for the given shards that are not saved yet
+# work(start, end) gets the range of items of one shard and returns its counts (numpy array)
+def run_shards(job_dir, num_items, num_shards, work, shards=None, description=None):
+    os.makedirs(job_dir, exist_ok=True)
+    if description is not None:
+        with open(os.path.join(job_dir, 'job.json'), 'w') as file:
+            json.dump(description, file, sort_keys=True, indent=1)
+
+    done = set(completed_shards(job_dir, num_shards))
+    for index in (range(num_shards) if shards is None else shards):
+        if index in done:
+            continue
+        start, end = shard_bounds(num_items, num_shards, index)
+        counts = work(start, end)
+        # saved atomically, interrupted shard leaves no file and it is just computed again
+        store.save_arrays(shard_path(job_dir, index, num_shards), {'counts': counts, 'bounds': np.array([start, end])})
+        done.add(index)
+    return sorted(done)
+
+
+# sum of the counts of all shards, all of them have to be completed
+def merge_shards(job_dir, num_shards):
+    missing = sorted(set(range(num_shards)) - set(completed_shards(job_dir, num_shards)))
+    if missing:
+        raise ValueError('%d of %d shards are missing in %s, e.g. shard %d' % (len(missing), num_shards, job_dir,
+                                                                                 missing[0]))
+    total = None
+    for index in range(num_shards):
+        with np.load(shard_path(job_dir, index, num_shards)) as arrays:
+            total = arrays['counts'].astype(np.int64) if total is None else total + arrays['counts']
+    return total
@@ -0,0 +1,314 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Bounds on the best throughput a topology can give a traffic matrix, independent of routing (maximum concurrent
+# multi-commodity flow: largest lambda such that every flow can get rate lambda at the same time).
+# We use the Garg-Koenemann algorithm (in Fleischer's version, commodities of one source routed together over
+# a shortest path tree): every arc has a length, flow is pushed over the shortest paths and lengths of the used
+# arcs grow exponentially with their load. The pushed flow scaled down by the worst congestion is feasible, so it
+# gives a lower bound, and by LP duality any lengths give an upper bound D(l) / alpha(l), where D(l) is the sum of
+# capacity * length over arcs and alpha(l) is the sum of demand * shortest distance over commodities.
+# The run stops when the bounds are within a factor of 1 + epsilon. A finished run (its lengths and flow on paths)
+# can be passed to a run on a slightly changed topology (warm start), which then starts from the flow of the
+# previous run instead of from zero. That pays off when the edit changes the optimum by less than about epsilon,
+# a warm start that falls behind a cold run is dropped.
+
+import heapq
+import math
+import numpy as np
+
+import topo
+import traffic
+
+
+# shortest path tree from the source, lengths are indexed by arc id, returns lists of distances and previous arcs
+def shortest_path_tree(offsets, targets, lengths, source):
+    dist = [math.inf] * (len(offsets) - 1)
+    previous_arc = [-1] * (len(offsets) - 1)
+    dist[source] = 0.0
+    p_queue = [(0.0, source)]
+    while p_queue:
+        cost, current = heapq.heappop(p_queue)
+        # stale entry, the node was reached cheaper before
+        if cost > dist[current]:
+            continue
+        for arc in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[arc]
+            new_cost = cost + lengths[arc]
+            if new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                previous_arc[neighbor] = arc
+                heapq.heappush(p_queue, (new_cost, neighbor))
+    return dist, previous_arc
+
+
+# commodities (switch pairs with demands) grouped by source: list of (source, targets, demands, commodity ids)
+def group_commodities(pairs, demands):
+    groups = []
+    order = np.argsort(pairs[:, 0], kind='stable')
+    sources, starts = np.unique(pairs[order, 0], return_index=True)
+    for source, group in zip(sources.tolist(), np.split(order, starts[1:])):
+        groups.append((source, pairs[group, 1].tolist(), demands[group].tolist(), group.tolist()))
+    return groups
+
+
+# upper bound D(l) / alpha(l) for the lengths, raises ValueError when some target can not be reached from its
+# source (no flow can be routed at all then)
+def dual_bound(csr_lists, capacities, lengths, groups):
+    offsets, sources, targets, link_of = csr_lists
+    alpha = 0.0
+    for source, group_targets, group_demands, _ in groups:
+        dist, _ = shortest_path_tree(offsets, targets, lengths, source)
+        alpha += sum(demand * dist[target] for target, demand in zip(group_targets, group_demands))
+    if alpha == math.inf:
+        raise ValueError('some flows have no path between their switches')
+    return float(np.dot(capacities, lengths)) / alpha if alpha > 0 else math.inf
+
+
+# a warm started run is compared with the cold run every this many phases, during the first half of the phases the
+# cold run needed (later a restart can not pay off any more), and starts again with cold lengths when it is behind
+WARM_CHECK_PHASES = 10
+
+
+# bounds on the maximum concurrent flow of the commodities (switch pairs of shape (n, 2) with demands) in the CSR
+# graph, link_capacities are indexed by link id (both directions of a link have the full capacity, default -
+# capacities of the CSR graph)
+# warm_start is the result of a previous run (possibly on a slightly different topology, a run without any
+# commodities gives a cold start), the run also stops as soon as the lower bound reaches limit (when something else
+# limits lambda anyway). Raises ValueError when some switch pair is not connected.
+# Returns dict with 'lower' and 'upper' bound on lambda, 'lengths', 'paths' (flow on each path of each switch
+# pair) and 'reference' (lower bound relative to the upper one after every phase of the last cold run, this one or
+# the one the warm start came from) for warm starts and number of 'phases' (routing of the missing flow of a warm
+# start counts as one).
+def max_concurrent_flow(csr, pairs, demands, link_capacities=None, epsilon=0.1, warm_start=None, limit=math.inf,
+                        max_phases=10000):
+    pairs = np.asarray(pairs).reshape(-1, 2)
+    demands = np.asarray(demands, dtype=np.float64)
+    keep = (pairs[:, 0] != pairs[:, 1]) & (demands > 0)
+    pairs, demands = pairs[keep], demands[keep]
+    if not len(pairs):
+        return {'lower': math.inf, 'upper': math.inf, 'lengths': None, 'paths': {}, 'reference': [], 'phases': 0}
+    if link_capacities is None:
+        link_capacities = csr.capacities
+    capacities = np.asarray(link_capacities, dtype=np.float64)[csr.link_of]
+    csr_lists = csr.lists()
+    offsets, sources, targets, link_of = csr_lists
+    groups = group_commodities(pairs, demands)
+    num_arcs = csr.num_arcs
+
+    # initial lengths delta / capacity as in the algorithm, the first upper bound of a warm start comes from the
+    # lengths of the previous run (they are close to the optimal dual)
+    delta = (num_arcs / (1 - epsilon)) ** (-1 / epsilon)
+    cold_lengths = delta / capacities
+    lengths = cold_lengths
+    if warm_start is not None and warm_start['lengths'] is None:
+        warm_start = None
+    if warm_start is not None:
+        lengths = warm_start_lengths(csr, warm_start['lengths'])
+
+    upper = dual_bound(csr_lists, capacities, lengths.tolist(), groups)
+    # demands are scaled by the upper bound, so one phase routes about as much as the network can carry at once
+    scale = upper if math.isfinite(upper) else 1.0
+    routed = np.zeros(len(pairs))
+    flow = np.zeros(num_arcs)
+    total = float(np.dot(capacities, cold_lengths))
+    lengths = cold_lengths.tolist()
+    capacities_list = capacities.tolist()
+    # flow on every used path, key is (commodity, nodes of the path)
+    path_flows = {}
+
+    # sending the amounts from the source to its targets over shortest path trees, each step is limited by the
+    # tightest arc of the tree and lengths of the used arcs grow with their load
+    def route(source, group_targets, group_ids, amounts):
+        nonlocal total
+        remaining = list(amounts)
+        while total < 1 and any(amount > 0 for amount in remaining):
+            dist, previous_arc = shortest_path_tree(offsets, targets, lengths, source)
+            # load of the tree arcs when all remaining demands of the source are sent over the tree
+            load = {}
+            paths = []
+            for target, amount in zip(group_targets, remaining):
+                node = target
+                nodes = [node]
+                while amount > 0 and node != source and previous_arc[node] != -1:
+                    arc = previous_arc[node]
+                    load[arc] = load.get(arc, 0.0) + amount
+                    node = sources[arc]
+                    nodes.append(node)
+                paths.append(tuple(reversed(nodes)))
+            if not load:
+                break
+            step = min(1.0, min(capacities_list[arc] / amount for arc, amount in load.items()))
+            for arc, amount in load.items():
+                sent = amount * step
+                flow[arc] += sent
+                old_length = lengths[arc]
+                lengths[arc] = old_length * (1 + epsilon * sent / capacities_list[arc])
+                total += capacities_list[arc] * (lengths[arc] - old_length)
+            for idx, commodity in enumerate(group_ids):
+                if remaining[idx] > 0:
+                    sent = remaining[idx] * step
+                    routed[commodity] += sent
+                    key = (commodity, paths[idx])
+                    path_flows[key] = path_flows.get(key, 0.0) + sent
+                    remaining[idx] -= sent
+                    if remaining[idx] < 1e-12 * scale:
+                        remaining[idx] = 0.0
+
+    # lengths of the arcs as they would be after routing the flow from the start (each step grows the length of the
+    # arc at least (1 + epsilon) ** (sent / capacity) times)
+    def flow_lengths():
+        nonlocal lengths, total
+        new_lengths = cold_lengths * (1 + epsilon) ** (flow / capacities)
+        total = float(np.dot(capacities, new_lengths))
+        lengths = new_lengths.tolist()
+
+    lower = 0.0
+    phases = 0
+    # lower bounds given by the flow of this run after every phase, and of the cold run to compare a warm start with
+    history = []
+    reference = None
+    if warm_start is not None:
+        reference = warm_start['reference']
+        # paths of the previous run that still exist keep their flow, at full amounts - the arc lengths are rebuilt
+        # from it, so they match the flow as if this run had routed it and congestion stays what it was
+        arc_index = {pair: arc for arc, pair in enumerate(zip(sources, targets))}
+        commodity_index = {pair: idx for idx, pair in enumerate(map(tuple, pairs.tolist()))}
+        for pair, pair_paths in warm_start['paths'].items():
+            commodity = commodity_index.get(pair)
+            if commodity is None:
+                continue
+            for nodes, amount in pair_paths.items():
+                arcs = [arc_index.get(arc) for arc in zip(nodes, nodes[1:])]
+                if None not in arcs:
+                    flow[arcs] += amount
+                    routed[commodity] += amount
+                    path_flows[(commodity, nodes)] = amount
+        flow_lengths()
+        # switch pairs that lost some of the flow (or have a bigger demand) get the missing flow routed again, all
+        # of it in one pass over the sources (like a phase), so they are even with the others
+        deficits = (routed / demands).max() * demands - routed
+        deficits[deficits < 1e-9 * scale * demands] = 0.0
+        if deficits.any():
+            for source, group_targets, group_demands, group_ids in groups:
+                if deficits[group_ids].max() > 0:
+                    route(source, group_targets, group_ids, deficits[group_ids].tolist())
+            phases += 1
+
+    while True:
+        # feasible flow: routed amounts scaled down by the worst congestion
+        congestion = float((flow / capacities).max())
+        history.append(float((routed / demands).min()) / congestion if congestion > 0 else 0.0)
+        lower = max(lower, history[-1])
+        if phases or warm_start is not None:
+            upper = min(upper, dual_bound(csr_lists, capacities, lengths, groups))
+        if upper <= (1 + epsilon) * lower or lower >= limit or total >= 1 or phases >= max_phases:
+            break
+        # warm start that is behind the cold run after as many phases is dropped, the run continues from cold
+        # lengths and zero flow (the bounds found so far stay valid) and becomes the cold run
+        if reference and phases and phases % WARM_CHECK_PHASES == 0 and 2 * phases <= len(reference) and \
+                lower < reference[phases] * upper:
+            flow[:] = 0.0
+            routed[:] = 0.0
+            path_flows.clear()
+            flow_lengths()
+            history = [0.0]
+            reference = None
+        for source, group_targets, group_demands, group_ids in groups:
+            route(source, group_targets, group_ids, [demand * scale for demand in group_demands])
+        phases += 1
+
+    paths = {}
+    for (commodity, nodes), amount in path_flows.items():
+        paths.setdefault(tuple(pairs[commodity].tolist()), {})[nodes] = amount
+    return {
+        'lower': lower,
+        'upper': upper,
+        'lengths': link_lengths(csr, np.array(lengths)),
+        'paths': paths,
+        'reference': reference if reference is not None else [lower_bound / upper if upper > 0 else 0.0
+                                                              for lower_bound in history],
+        'phases': phases,
+    }
+
+
+# arc lengths as array of shape (num_links, 2) with the two directions of every link (lower index node -> higher,
+# and back), together with the links, so they can be matched to arcs of another CSR graph of an edited topology
+def link_lengths(csr, lengths):
+    forward = csr.sources <= csr.targets
+    result = np.zeros((csr.num_links, 2))
+    result[csr.link_of, np.where(forward, 0, 1)] = lengths
+    return {'links': np.sort(csr.links, axis=1), 'lengths': result}
+
+
+# arc lengths of the CSR graph from link_lengths of another graph over the same nodes, arcs of new links get the
+# median length, so they are neither avoided nor preferred at the start
+def warm_start_lengths(csr, warm_start):
+    num_nodes = csr.num_nodes
+    old_links = warm_start['links'].astype(np.int64)
+    old_keys = old_links[:, 0] * num_nodes + old_links[:, 1]
+    order = np.argsort(old_keys)
+    low = np.minimum(csr.sources, csr.targets).astype(np.int64)
+    high = np.maximum(csr.sources, csr.targets).astype(np.int64)
+    keys = low * num_nodes + high
+    positions = np.minimum(np.searchsorted(old_keys[order], keys), len(order) - 1)
+    found = old_keys[order][positions] == keys
+    directions = np.where(csr.sources <= csr.targets, 0, 1)
+    lengths = np.full(csr.num_arcs, float(np.median(warm_start['lengths'])))
+    lengths[found] = warm_start['lengths'][order[positions[found]], directions[found]]
+    return lengths
+
+
+# bounds on the throughput every flow of the server traffic matrix (src, dst) can get at the same time, in units
+# of server_capacity (default - the default link capacity, topology_bounds takes it from the topology). Flows are
+# grouped into switch pairs, server links only limit the flows of their own server, so they give an exact bound of
+# their own and lambda is the smaller of the two.
+def throughput_bounds(csr, server_switches, src, dst, link_capacities=None, server_capacity=None, epsilon=0.1,
+                      warm_start=None):
+    if server_capacity is None:
+        server_capacity = topo.DEFAULT_CAPACITY
+    num_servers = len(server_switches)
+    busiest = max(int(np.bincount(src, minlength=num_servers).max(initial=0)),
+                  int(np.bincount(dst, minlength=num_servers).max(initial=0)))
+    server_bound = server_capacity / busiest if busiest else math.inf
+    pairs, counts = traffic.switch_demands(src, dst, server_switches)
+    result = max_concurrent_flow(csr, pairs, counts, link_capacities, epsilon, warm_start, server_bound)
+    result['lower'] = min(result['lower'], server_bound) / server_capacity
+    result['upper'] = min(result['upper'], server_bound) / server_capacity
+    return result
+
+
+# throughput bounds of the whole topology object, servers are indexed in order of topology.servers
+def topology_bounds(topology, src, dst, **options):
+    options.setdefault('server_capacity', topology.server_capacity())
+    return throughput_bounds(topology.to_csr(), topology.server_switches(), src, dst, **options)
+
+
+if __name__ == "__main__":
+    import store
+
+    # optimal throughput of fat tree and jellyfish (k = 14) under random permutation traffic
+    num_ports = 14
+    num_servers = int((num_ports ** 3) / 4)
+    num_switches = int(num_ports * num_ports * 5 / 4)
+    topologies = {
+        'fattree': store.load_topology('fattree', (num_ports,)),
+        'jellyfish': store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0),
+    }
+    for name, topology in topologies.items():
+        src, dst = traffic.random_permutation(len(topology.servers), seed=0)
+        result = topology_bounds(topology, src, dst)
+        print('%-10s throughput between %.3f and %.3f (%d phases)'
+              % (name, result['lower'], result['upper'], result['phases']))
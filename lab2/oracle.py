@@ -0,0 +1,256 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Approximate hop distances for graphs too big for all pairs matrices (10k+ switches). A few landmark nodes get a
+# BFS tree each, kept as arrays of hop counts (uint8) and parents (int32), so memory is 5 bytes per landmark and
+# node. By the triangle inequality, for every landmark l
+#   |d(l, u) - d(l, v)| <= d(u, v) <= d(l, u) + d(l, v)
+# so bounds of any number of pairs are a few numpy operations over the landmark rows. Pairs whose bounds differ can
+# be refined exactly by bidirectional BFS, which stops at the upper bound. Path length histograms and mean path
+# lengths of traffic matrices are then estimated from random samples of server pairs, with standard errors.
+
+import numpy as np
+
+import topo
+
+UNREACHABLE = 255
+STRATEGIES = ('farthest', 'degree', 'random')
+
+
+# hop count between two nodes of the CSR graph (-1 if not connected), BFS runs from both ends and always expands
+# the smaller frontier, so it visits about square root of what BFS from one end would. With upper (a known upper
+# bound) the search stops when the frontiers can not meet any closer and returns the bound.
+def bidirectional_bfs(csr, source, target, upper=None):
+    if source == target:
+        return 0
+    offsets, _, targets, _ = csr.lists()
+    # distances from the source side and from the target side
+    seen = ({source: 0}, {target: 0})
+    frontiers = ([source], [target])
+    levels = [0, 0]
+    while frontiers[0] and frontiers[1]:
+        if upper is not None and levels[0] + levels[1] + 1 >= upper:
+            return upper
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        mine, other = seen[side], seen[1 - side]
+        levels[side] += 1
+        best = None
+        new_frontier = []
+        for node in frontiers[side]:
+            for arc in range(offsets[node], offsets[node + 1]):
+                neighbor = targets[arc]
+                if neighbor in mine:
+                    continue
+                mine[neighbor] = levels[side]
+                new_frontier.append(neighbor)
+                if neighbor in other:
+                    # the whole level is finished, another meeting node may be closer to the other side
+                    distance = levels[side] + other[neighbor]
+                    best = distance if best is None else min(best, distance)
+        if best is not None:
+            return best
+        frontiers = (new_frontier, frontiers[1]) if side == 0 else (frontiers[0], new_frontier)
+    return -1
+
+
+# Landmark distance oracle of the CSR graph. Landmarks are picked by strategy: 'farthest' - each next landmark is
+# the node farthest from the chosen ones (spread over the graph, good lower bounds), 'degree' - nodes with the most
+# links, 'random' - uniformly at random.
+class LandmarkOracle:
+    def __init__(self, csr, num_landmarks=16, strategy='farthest', seed=0):
+        if strategy not in STRATEGIES:
+            raise ValueError('unknown landmark strategy: ' + str(strategy))
+        self.csr = csr
+        num_landmarks = min(num_landmarks, csr.num_nodes)
+        rng = np.random.default_rng(seed)
+        self.dist = np.full((num_landmarks, csr.num_nodes), UNREACHABLE, dtype=np.uint8)
+        self.parent = np.full((num_landmarks, csr.num_nodes), -1, dtype=np.int32)
+        degrees = np.diff(csr.offsets)
+
+        if strategy == 'farthest':
+            landmarks = [int(rng.integers(csr.num_nodes))]
+            # distance to the closest landmark so far, unreachable nodes are the farthest
+            closest = np.full(csr.num_nodes, np.iinfo(np.int32).max, dtype=np.int64)
+        elif strategy == 'degree':
+            landmarks = np.argsort(-degrees, kind='stable')[:num_landmarks].tolist()
+        else:
+            landmarks = rng.choice(csr.num_nodes, num_landmarks, replace=False).tolist()
+
+        for idx in range(num_landmarks):
+            dist, previous = topo.bfs(csr, landmarks[idx])
+            if dist.max() >= UNREACHABLE:
+                raise ValueError('hop counts from %d do not fit into uint8' % UNREACHABLE)
+            self.dist[idx] = np.where(dist < 0, UNREACHABLE, dist)
+            self.parent[idx] = previous
+            if strategy == 'farthest' and idx + 1 < num_landmarks:
+                closest = np.minimum(closest, np.where(dist < 0, np.iinfo(np.int32).max, dist))
+                closest[landmarks] = -1
+                landmarks.append(int(np.argmax(closest)))
+        self.landmarks = np.array(landmarks, dtype=np.int64)
+
+    # lower and upper bounds of hop counts between sources[i] and targets[i] (numbers or arrays of node indices),
+    # as float arrays - inf for pairs in different components (lower and upper) or not reached by any landmark
+    # (upper), bounds of pairs with a landmark are exact
+    def bounds(self, sources, targets):
+        source_dist = self.dist[:, np.asarray(sources)].astype(np.int64)
+        target_dist = self.dist[:, np.asarray(targets)].astype(np.int64)
+        source_reached = source_dist != UNREACHABLE
+        target_reached = target_dist != UNREACHABLE
+        both = source_reached & target_reached
+        lower = np.where(both, np.abs(source_dist - target_dist), 0).max(axis=0).astype(np.float64)
+        upper = np.where(both, source_dist + target_dist, np.iinfo(np.int32).max).min(axis=0).astype(np.float64)
+        upper[upper >= np.iinfo(np.int32).max] = np.inf
+        # a landmark that reaches only one of the nodes proves they are not connected
+        separated = (source_reached != target_reached).any(axis=0)
+        lower[separated] = np.inf
+        upper[separated] = np.inf
+        return lower, upper
+
+    # hop counts between the pairs, bounds where they meet and bidirectional BFS (limited by the upper bound)
+    # elsewhere. Returns float array, inf for pairs that are not connected, and number of searched pairs.
+    def distances(self, sources, targets):
+        sources = np.atleast_1d(np.asarray(sources))
+        targets = np.atleast_1d(np.asarray(targets))
+        lower, upper = self.bounds(sources, targets)
+        result = upper.copy()
+        loose = np.flatnonzero(lower < upper)
+        for idx in loose.tolist():
+            bound = None if upper[idx] == np.inf else int(upper[idx])
+            distance = bidirectional_bfs(self.csr, int(sources[idx]), int(targets[idx]), bound)
+            result[idx] = np.inf if distance < 0 else distance
+        return result, len(loose)
+
+    # exact hop count of one pair (-1 if not connected)
+    def distance(self, source, target):
+        distance = self.distances(source, target)[0][0]
+        return -1 if distance == np.inf else int(distance)
+
+    # path (list of nodes) between two nodes through the landmark with the smallest upper bound, following the two
+    # BFS trees until they meet, so its length is at most the upper bound ([] if no landmark reaches both)
+    def path(self, source, target):
+        total = self.dist[:, source].astype(np.int64) + self.dist[:, target]
+        best = int(np.argmin(total))
+        if total[best] >= UNREACHABLE:
+            return []
+        parent = self.parent[best]
+        up = [source]
+        while up[-1] != self.landmarks[best]:
+            up.append(int(parent[up[-1]]))
+        positions = {node: pos for pos, node in enumerate(up)}
+        down = [target]
+        while down[-1] not in positions:
+            down.append(int(parent[down[-1]]))
+        return up[:positions[down[-1]]] + down[::-1]
+
+
+# random pairs of different servers (uniform), as the switches of the two servers
+def sample_server_pairs(server_switches, num_samples, rng):
+    server_switches = np.asarray(server_switches)
+    num_servers = len(server_switches)
+    src = rng.integers(num_servers, size=num_samples)
+    dst = rng.integers(num_servers - 1, size=num_samples)
+    dst += dst >= src
+    return server_switches[src], server_switches[dst]
+
+
+# server path lengths (hops with the server links) of pairs of switches, servers on the same switch have length 2
+# exact distances, or only bounds with exact=False (returns lower and upper lengths)
+def server_path_lengths(oracle, src_switches, dst_switches, exact=True):
+    lower, upper = oracle.bounds(src_switches, dst_switches)
+    if exact:
+        distances, _ = oracle.distances(src_switches, dst_switches)
+        lower = upper = distances
+    same = np.asarray(src_switches) == np.asarray(dst_switches)
+    return np.where(same, 2, lower + 2), np.where(same, 2, upper + 2)
+
+
+# estimated histogram of server pair path lengths (fractions, index is the length like in the histogram of
+# reproduce_1c) from num_samples random server pairs, errors are the standard errors of the fractions.
+# Disconnected pairs are left out of the fractions and counted in 'disconnected'. With exact=False only the
+# landmark bounds are used and the fractions are for upper bounds. 'tight' is the share of pairs with exact bounds.
+def path_length_estimate(oracle, server_switches, num_samples=10000, seed=0, exact=True):
+    rng = np.random.default_rng(seed)
+    src, dst = sample_server_pairs(server_switches, num_samples, rng)
+    lower, upper = server_path_lengths(oracle, src, dst, exact=False)
+    lengths = server_path_lengths(oracle, src, dst)[1] if exact else upper
+    connected = lengths != np.inf
+    counts = np.bincount(lengths[connected].astype(np.int64), minlength=3)
+    num_connected = max(int(connected.sum()), 1)
+    fractions = counts / num_connected
+    return {
+        'fractions': fractions,
+        'errors': np.sqrt(fractions * (1 - fractions) / num_connected),
+        'mean': float(lengths[connected].mean()) if connected.any() else 0.0,
+        'mean_error': float(lengths[connected].std(ddof=1) / np.sqrt(num_connected)) if connected.sum() > 1 else 0.0,
+        'disconnected': float(1 - connected.mean()),
+        'tight': float((lower == upper).mean()),
+    }
+
+
+# estimated mean server path length of flows of the traffic matrix (src, dst arrays of servers, see traffic.py)
+# from num_samples random flows (all flows when there are fewer), with its standard error. Flows between
+# disconnected servers are left out.
+def traffic_estimate(oracle, server_switches, src, dst, num_samples=10000, seed=0, exact=True):
+    server_switches = np.asarray(server_switches)
+    src = np.asarray(src)
+    dst = np.asarray(dst)
+    num_flows = len(src)
+    if num_samples < num_flows:
+        flows = np.random.default_rng(seed).choice(num_flows, num_samples, replace=False)
+        src, dst = src[flows], dst[flows]
+    _, lengths = server_path_lengths(oracle, server_switches[src], server_switches[dst], exact)
+    lengths = lengths[lengths != np.inf]
+    # flows are sampled without replacement, so the error goes to 0 when all of them are used
+    correction = np.sqrt(1 - len(src) / num_flows) if num_flows else 0.0
+    return {
+        'mean': float(lengths.mean()) if len(lengths) else 0.0,
+        'mean_error': float(correction * lengths.std(ddof=1) / np.sqrt(len(lengths))) if len(lengths) > 1 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    import time
+    import traffic
+
+    # jellyfish with 10k switches of 24 ports, 4 servers per switch
+    num_switches = 10000
+    num_ports = 24
+    topology = topo.Jellyfish(4 * num_switches, num_switches, num_ports, seed=0)
+    csr = topology.to_csr()
+    server_switches = topology.server_switches()
+
+    start = time.time()
+    oracle = LandmarkOracle(csr, 16)
+    print('%d landmarks of %d switches: %.2f s, %.1f MB' % (len(oracle.landmarks), csr.num_nodes,
+                                                            time.time() - start,
+                                                            (oracle.dist.nbytes + oracle.parent.nbytes) / 2 ** 20))
+
+    rng = np.random.default_rng(1)
+    src, dst = rng.integers(csr.num_nodes, size=(2, 100000))
+    start = time.time()
+    lower, upper = oracle.bounds(src, dst)
+    print('bounds of %d pairs: %.2f us per pair, %.1f%% tight, mean gap %.2f hops' % (
+        len(src), 1e6 * (time.time() - start) / len(src), 100 * (lower == upper).mean(), (upper - lower).mean()))
+    start = time.time()
+    exact, searched = oracle.distances(src[:2000], dst[:2000])
+    print('exact distances of 2000 pairs: %.2f ms per pair (%d searched)' % (
+        1e3 * (time.time() - start) / 2000, searched))
+
+    estimate = path_length_estimate(oracle, server_switches, 20000)
+    print('server path lengths: ' + ', '.join('%d: %.4f +- %.4f' % (length, fraction, error) for length, (
+        fraction, error) in enumerate(zip(estimate['fractions'], estimate['errors'])) if fraction > 0))
+    src, dst = traffic.random_permutation(len(server_switches), seed=0)
+    estimate = traffic_estimate(oracle, server_switches, src, dst, 5000)
+    print('random permutation mean path length: %.3f +- %.3f' % (estimate['mean'], estimate['mean_error']))
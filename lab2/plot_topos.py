@@ -15,7 +15,7 @@
 ##                                                            ##
 ################################################################
 
-import topo
+import store
 
 if __name__ == "__main__":
     # k - num_of_ports - as presented in lectures
@@ -26,10 +26,10 @@ if __name__ == "__main__":
     num_servers = int((num_ports ** 3) / 4)
     num_switches = int(num_ports * num_ports * 5 / 4)
 
-    fattree = topo.Fattree(num_ports)
+    fattree = store.load_topology('fattree', (num_ports,))
     fattree.plot(save=True)
 
-    jellyfish = topo.Jellyfish(num_servers, num_switches, num_ports)
+    jellyfish = store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0)
     jellyfish.plot(save=True, mode=2)
 
     # # _____________num_ports = 6___________________
@@ -38,10 +38,10 @@ if __name__ == "__main__":
     # num_servers = int((num_ports ** 3) / 4)
     # num_switches = int(num_ports * num_ports * 5 / 4)
     #
-    # fattree = topo.Fattree(num_ports)
+    # fattree = store.load_topology('fattree', (num_ports,))
     # fattree.plot(save=True)
     #
-    # jellyfish = topo.Jellyfish(num_servers, num_switches, num_ports)
+    # jellyfish = store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0)
     # jellyfish.plot(save=True, mode=2)
 
     # _____________num_ports = 8___________________
@@ -50,10 +50,10 @@ if __name__ == "__main__":
     num_servers = int((num_ports ** 3) / 4)
     num_switches = int(num_ports * num_ports * 5 / 4)
 
-    fattree = topo.Fattree(num_ports)
+    fattree = store.load_topology('fattree', (num_ports,))
     fattree.plot(save=True)
 
-    jellyfish = topo.Jellyfish(num_servers, num_switches, num_ports)
+    jellyfish = store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0)
     jellyfish.plot(save=True, mode=1)
 
     # _____________num_ports = 10___________________
@@ -62,10 +62,10 @@ if __name__ == "__main__":
     # num_servers = int((num_ports ** 3) / 4)
     # num_switches = int(num_ports * num_ports * 5 / 4)
     #
-    # fattree = topo.Fattree(num_ports)
+    # fattree = store.load_topology('fattree', (num_ports,))
     # fattree.plot(save=True)
     #
-    # jellyfish = topo.Jellyfish(num_servers, num_switches, num_ports)
+    # jellyfish = store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0)
     # jellyfish.plot(save=True, mode=1)
 
     # _____________num_ports = 12___________________
@@ -74,10 +74,10 @@ if __name__ == "__main__":
     # num_servers = int((num_ports ** 3) / 4)
     # num_switches = int(num_ports * num_ports * 5 / 4)
     #
-    # fattree = topo.Fattree(num_ports)
+    # fattree = store.load_topology('fattree', (num_ports,))
     # fattree.plot(save=True)
     #
-    # jellyfish = topo.Jellyfish(num_servers, num_switches, num_ports)
+    # jellyfish = store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0)
     # jellyfish.plot(save=True, mode=1)
 
     # _____________num_ports = 14___________________
@@ -86,8 +86,8 @@ if __name__ == "__main__":
     num_servers = int((num_ports ** 3) / 4)
     num_switches = int(num_ports * num_ports * 5 / 4)
 
-    fattree = topo.Fattree(num_ports)
+    fattree = store.load_topology('fattree', (num_ports,))
     fattree.plot(save=True)
 
-    jellyfish = topo.Jellyfish(num_servers, num_switches, num_ports)
+    jellyfish = store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0)
     jellyfish.plot(save=True, mode=1)
@@ -14,6 +14,7 @@
 # under the License.
 
 import topo
+import store
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -27,64 +28,55 @@ import matplotlib.pyplot as plt
 
 # TODO: code for reproducing Figure 1(c) in the jellyfish paper
 
-if __name__ == "__main__":
 
-    num_ports = 14
+# distribution of path lengths between all pairs of servers, index of the list is the path length
+# we only run the search over switches (bitset BFS from all of them at once) and weight each pair of switches
+# by number of servers connected to them, so pairs of servers are never enumerated
+def path_length_distribution(topology, length=10):
+    histogram = topo.path_length_histogram(topology.to_csr(), topology.servers_per_switch())
+    return to_distribution(histogram, length)
+
+
+# histogram as a list of at least length elements
+def to_distribution(histogram, length=10):
+    distribution = [0] * max(length, len(histogram))
+    for distance, count in enumerate(histogram):
+        distribution[distance] += int(count)
+    return distribution
+
+
+# merged distribution of path lengths for num_runs random jellyfish topologies with given number of ports
+# topologies are seeded (seed, seed + 1, ...) and kept in the topology store, so runs are reproducible
+def jellyfish_distribution(num_ports, num_runs=10, length=10, seed=0):
     num_servers = int((num_ports ** 3) / 4)
     num_switches = int(num_ports * num_ports * 5 / 4)
+    distribution = [0] * length
+    for run in range(num_runs):
+        arrays = store.load_arrays('jellyfish', (num_servers, num_switches, num_ports), seed + run)
+        histogram = topo.path_length_histogram(store.switch_csr(arrays), arrays['servers_per_switch'])
+        part = to_distribution(histogram, length)
+        distribution.extend([0] * (len(part) - len(distribution)))
+        for distance, count in enumerate(part):
+            distribution[distance] += count
+    return distribution
+
 
-    ft_distribution = [0] * 10
-    jf_distribution = [0] * 10
+if __name__ == "__main__":
+
+    num_ports = 14
 
     # _____________FATTREE___________________
     # region Fattree
 
-    # create topo
-    ft_topo = topo.Fattree(num_ports)
-
-    # calculate dijkstra for each switch
-    distance_ft = {}
-    for start_switch in ft_topo.switches:
-        part_distance, _ = topo.dijkstra(start_switch, ft_topo.switches)
-        for end_switch in part_distance:
-            distance_ft[(start_switch.id, end_switch.id)] = part_distance[end_switch]
-
-    # create list of all possible pairs of hosts (combination) in fact we just consider next hop from each host (
-    # there is just one) this allows us to run dijkstra for fewer nodes (just switches) than we will just add
-    # distance/cost of 2 (or some bandwidth) to the distance between two hosts connecting by those next-hops
-    ft_server_next_hop_id_list = [server.edges[0].rnode.id for server in ft_topo.servers]
-    ft_server_next_hop_pairs = [(a, b) for idx, a in enumerate(ft_server_next_hop_id_list) for b in
-                                ft_server_next_hop_id_list[idx + 1:]]
-
-    # for each pair of switches that are next-hop switches to add 2 as described above
-    for pair in ft_server_next_hop_pairs:
-        distance = distance_ft[pair] + 2
-        # we count the paths of particular cost
-        ft_distribution[distance] += 1
+    # for fattree path lengths follow from the addressing, no need to generate the topology
+    ft_distribution = to_distribution(topo.Fattree.path_length_distribution(num_ports))
     # endregion
 
     # _____________JELLYFISH___________________
     # region Jellyfish
 
     # we run jellyfish topo 10 times as done in paper
-    for _ in range(10):
-
-        # same steps as for fattree
-        jf_topo = topo.Jellyfish(num_servers, num_switches, num_ports)
-
-        distance_jf = {}
-        for start_switch in jf_topo.switches:
-            part_distance, _ = topo.dijkstra(start_switch, jf_topo.switches)
-            for end_switch in part_distance:
-                distance_jf[(start_switch.id, end_switch.id)] = part_distance[end_switch]
-
-        jf_server_next_hop_id_list = [server.edges[0].rnode.id for server in jf_topo.servers]
-        jf_server_next_hop_pairs = [(a, b) for idx, a in enumerate(jf_server_next_hop_id_list) for b in
-                                    jf_server_next_hop_id_list[idx + 1:]]
-
-        for pair in jf_server_next_hop_pairs:
-            distance = distance_jf[pair] + 2
-            jf_distribution[distance] += 1
+    jf_distribution = jellyfish_distribution(num_ports, 10)
     # endregion
 
     # _____________PLOTTING___________________
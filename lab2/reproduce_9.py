@@ -13,18 +13,16 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import argparse
 import topo
-import operator
+import store
+import jobs
+import traffic
+import numpy as np
 import matplotlib.pyplot as plt
-import copy
-import sys
-from multiprocessing import Manager
 import multiprocessing as mp
 from tqdm import tqdm
 
-sys.setrecursionlimit(10000)
-progress_bar = None
-
 
 # # Setup for Jellyfish
 # num_servers = 686
@@ -35,118 +33,141 @@ progress_bar = None
 
 # TODO: code for reproducing Figure 9 in the jellyfish paper
 
-# function to get exactly k number of the shortest paths
+# function to get arcs of exactly k number of the shortest paths, as one flat array of arc ids
+# (arc is one direction of a link in the CSR graph, so arc ids are dense integer ids of directed links)
 def get_k_shortest_paths(array, k):
-    result = []
-    for x in range(min(k, len(array))):
-        result.append(array[x]['path'])
-    return result
-
-
-# function to get exactly k paths that are not longer than the shortest one
-def get_shortest_paths_max_k(array, k):
-    result = []
-    threshold = array[0]['cost']
-    for x in range(min(k, len(array))):
-        if array[x]['cost'] != threshold:
-            return result
-        result.append(array[x]['path'])
-    return result
-
-
-# function to count paths that are on each link
-def count_paths(array):
-    counter = {}
-    for route in array:
-        for x in range(len(route) - 1):
-            if hash_nodes(route[x], route[x + 1]) in counter.keys():
-                # if path goes through the link - we increase the counter
-                counter[hash_nodes(route[x], route[x + 1])] += 1
-            else:
-                counter[hash_nodes(route[x], route[x + 1])] = 1
-    return counter
+    return np.array([arc for path in array[:k] for arc in path['arcs']], dtype=np.int32)
+
+
+# function to count paths that are on each link, from flat arrays of arc ids
+def count_paths(arc_arrays, num_arcs):
+    if not arc_arrays:
+        return np.zeros(num_arcs, dtype=np.int64)
+    return np.bincount(np.concatenate(arc_arrays), minlength=num_arcs)
 
 
 # this function prepares set to be plotted
-# we sort the set with all links and corresponding number of paths on this link
-# than we match it with incremental rank of the link
-def prepare_data_for_plotting(array):
-    sorted_array = sorted(array.items(), key=operator.itemgetter(1))
-    result_set = [[0], [0]]
-    last_rank = 0
-    last_value = 0
-    result_set[0].append(last_rank)
-    result_set[1].append(last_value)
-    for item in sorted_array:
-        # for each link we increase the rank
-        last_rank += 1
-        # if there is change in number of paths link is on we store new values to teh result set
-        if last_value != item[1]:
-            result_set[0].append(last_rank)
-            result_set[1].append(last_value)
-            last_value = item[1]
-    return result_set
-
-
-# utility function to hash each link - we use string consisting of corresponding node's ids
-def hash_nodes(node1, node2):
-    return str(node1.type) + str(node1.id) + ':' + str(node2.type) + str(node2.id)
-
-
-# function that is executed in each process
-def thread_wrapper(res_k8, res_e8, res_e64, graph, pair_th):
-    # we run Yen's algorithm for two switches
-    part_result = topo.ksp_yen(graph, pair_th[0], pair_th[1], 16)
-    # and we merge the results, respecting 3 separate sets for each routing method
-    res_k8.extend(get_k_shortest_paths(part_result, 8))
-    res_e8.extend(get_shortest_paths_max_k(part_result, 8))
-    res_e64.extend(get_shortest_paths_max_k(part_result, 16))
-
-
-# utility function used for reporting process to the progress bar displayed to the user
-def update(*a):
-    progress_bar.update()
+# we sort the links by number of paths on them and match them with incremental rank of the link
+def prepare_data_for_plotting(counts):
+    ranks = np.arange(len(counts) + 1)
+    values = np.concatenate(([0], np.sort(counts)))
+    return [ranks, values]
+
+
+# graph used by the worker process, published once by the pool initializer instead of sending it with each task
+# BFS trees of the targets are kept between tasks, so the worker computes each of them only once
+worker_csr = None
+worker_trees = {}
+
+
+def init_worker(csr):
+    global worker_csr
+    worker_csr = csr
+    worker_trees.clear()
+
+
+# function that is executed in each process, for one source switch and a chunk of its target switches it returns
+# number of paths on each arc for the 3 routing methods (rows: 8 shortest paths, 8-way ECMP, 64-way ECMP),
+# so only small arrays go back
+# ECMP sets are random samples of the equal cost paths (the first ones in DFS order always use the same low index
+# neighbours), the generator is seeded by the pair, so results do not depend on how pairs are split into tasks
+def count_chunk(task):
+    source, targets, seed = task
+    csr = worker_csr
+    # we run Yen's algorithm for all targets of the source at once, sharing the searches
+    part_results = topo.ksp_from_source(csr, source, targets.tolist(), 8, worker_trees)
+    # equal cost paths are sampled from the shortest path DAG of the source
+    dag = topo.ShortestPathDAG(csr, source)
+    res_k8 = []
+    res_e8 = []
+    res_e64 = []
+    for target, part_result in part_results.items():
+        rng = np.random.default_rng((seed, source, target))
+        res_k8.append(get_k_shortest_paths(part_result, 8))
+        res_e8.append(get_k_shortest_paths(dag.sample_paths(target, 8, rng), 8))
+        res_e64.append(get_k_shortest_paths(dag.sample_paths(target, 64, rng), 64))
+    return np.stack((count_paths(res_k8, csr.num_arcs), count_paths(res_e8, csr.num_arcs),
+                     count_paths(res_e64, csr.num_arcs)))
+
+
+# splitting pairs (array of shape (n, 2)) into tasks (source, targets) with at most chunk_size targets
+def group_by_source(pairs, chunk_size):
+    tasks = []
+    for source in np.unique(pairs[:, 0]):
+        targets = pairs[pairs[:, 0] == source, 1]
+        for start in range(0, len(targets), chunk_size):
+            tasks.append((int(source), targets[start:start + chunk_size]))
+    return tasks
+
+
+# running count_chunk for all pairs in the pool of worker processes, partial counts are summed up as they come back
+# seed is the seed of ECMP path sampling
+def count_pairs(pool, csr, pairs, chunk_size=50, seed=0):
+    tasks = [(source, targets, seed) for source, targets in group_by_source(pairs, chunk_size)]
+    counts = np.zeros((3, csr.num_arcs), dtype=np.int64)
+    for part in tqdm(pool.imap_unordered(count_chunk, tasks), total=len(tasks)):
+        counts += part
+    return counts
+
+
+def make_pool(csr, processes=None):
+    return mp.Pool(processes or mp.cpu_count(), initializer=init_worker, initargs=(csr,))
+
+
+# same as count_pairs, with its own pool of workers (number depends on the CPU, no of cores)
+def run_parallel(csr, pairs, processes=None, chunk_size=50, seed=0):
+    with make_pool(csr, processes) as pool:
+        return count_pairs(pool, csr, pairs, chunk_size, seed)
 
 
 if __name__ == "__main__":
+    # the pairs are split into shards that are saved to disk one by one, so an interrupted run continues where it
+    # stopped, and shards can be computed on different machines (--shards) and merged afterwards (--merge)
+    parser = argparse.ArgumentParser(description='Reproducing figure 9 of the jellyfish paper')
+    parser.add_argument('--num-shards', type=int, default=10, help='number of shards the switch pairs are split into')
+    parser.add_argument('--shards', default=None, help='shards computed by this run, e.g. 0-4,7 (default: all)')
+    parser.add_argument('--merge', action='store_true', help='only merge the saved shards and plot the figure')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+
     # our setup for the figure 9, just like in the paper
     num_ports = 14
     num_servers = int((num_ports ** 3) / 4)
     num_switches = int(num_ports * num_ports * 5 / 4)
-
-    # multiprocessing safe lists
-    manager = Manager()
-    set_k8 = manager.list()
-    set_e8 = manager.list()
-    set_e64 = manager.list()
-
-    # initializing the jellyfish topology
-    jf_topo = topo.Jellyfish(num_servers, num_switches, num_ports)
-
-    # pool of workers (processes), number depends on the CPU (no of cores)
-    pool = mp.Pool(mp.cpu_count())
-    progress_bar = tqdm(total=1000)
-
-    # since the connections are random, we will perform 1000 iterations of Yen's algorithm
-    # # (paths between two random switches)
-    for idx in range(1000):
-        # we copy our topo into each process (needed because Yen's implementation is removing nodes from graph)
-        # if you run this on Windows, you should change it to copy.copy()
-        data = copy.deepcopy(jf_topo)
-        jf_switches_links = [(a, b) for idx, a in enumerate(data.switches) for b in data.switches[idx + 1:]]
-        # we choose random pair of switches and register new worker process
-        pair = jf_switches_links[idx]
-        pool.apply_async(thread_wrapper, args=(set_k8, set_e8, set_e64, data.switches, pair), callback=update)
-
-    # we close the pool and wait for all processes to finish its work
-    pool.close()
-    pool.join()
+    seed = 0
+
+    # initializing the jellyfish topology (seeded, loaded from the topology store if it was generated before)
+    jf_topo = store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=seed)
+
+    # switch graph with switch indices as nodes, paths are just integers
+    # Yen's implementation does not modify the graph, so all tasks share the same topology
+    jf_csr = topo.CSRGraph(range(len(jf_topo.switches)), jf_topo.links)
+
+    # like in the paper, paths are computed for random permutation traffic between the servers
+    # (every server sends to one other server), each distinct pair of their switches is one run of Yen's algorithm
+    src, dst = traffic.random_permutation(num_servers, seed)
+    jf_switches_links, _ = traffic.switch_demands(src, dst, jf_topo.server_switches())
+
+    # the job is identified by everything its shards depend on
+    description = {'topology': store.topology_key('jellyfish', (num_servers, num_switches, num_ports), seed),
+                   'traffic': 'permutation', 'traffic_seed': seed, 'num_shards': args.num_shards,
+                   'methods': ['k8', 'e8', 'e64'], 'ecmp_seed': seed}
+    job_dir = jobs.job_directory('figure9', description)
+
+    if not args.merge:
+        shards = jobs.parse_shards(args.shards, args.num_shards)
+        with make_pool(jf_csr, args.processes) as pool:
+            def work(start, end):
+                return count_pairs(pool, jf_csr, jf_switches_links[start:end], seed=seed)
+            done = jobs.run_shards(job_dir, len(jf_switches_links), args.num_shards, work, shards, description)
+        if len(done) < args.num_shards:
+            print('%d of %d shards done in %s, run the remaining ones and then --merge' % (len(done), args.num_shards,
+                                                                                         job_dir))
+            raise SystemExit(0)
+
+    set_k8, set_e8, set_e64 = jobs.merge_shards(job_dir, args.num_shards)
 
     # we process the results and preparing them for plotting
-    set_k8 = count_paths(set_k8)
-    set_e8 = count_paths(set_e8)
-    set_e64 = count_paths(set_e64)
-
     set_k8 = prepare_data_for_plotting(set_k8)
     set_e8 = prepare_data_for_plotting(set_e8)
     set_e64 = prepare_data_for_plotting(set_e64)
@@ -0,0 +1,118 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# On-disk store of generated topologies. Each topology is saved as .npz file (edge list with link capacities and
+# latencies, node ids and types, servers per switch and generator state) named by hash of (kind, params, seed),
+# so any script or process asking for the same topology loads it from disk instead of generating it again.
+
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+
+import topo
+
+# bump when the saved arrays change, so old files are not used
+STORE_VERSION = 4
+DEFAULT_DIRECTORY = 'topologies'
+
+# kinds of topologies and how they are generated from params and seed
+KINDS = {
+    'fattree': lambda params, seed: topo.Fattree(*params),
+    'jellyfish': lambda params, seed: topo.Jellyfish(*params, seed=seed),
+}
+CLASSES = {
+    'fattree': topo.Fattree,
+    'jellyfish': topo.Jellyfish,
+}
+
+
+def generate(kind, params, seed=None):
+    if kind not in KINDS:
+        raise ValueError('unknown topology kind: ' + str(kind))
+    return KINDS[kind](tuple(params), seed)
+
+
+# content address of the topology
+def topology_key(kind, params, seed=None):
+    description = json.dumps([STORE_VERSION, kind, [int(param) for param in params], seed])
+    return kind + '-' + hashlib.sha1(description.encode()).hexdigest()[:16]
+
+
+def topology_path(kind, params, seed=None, directory=DEFAULT_DIRECTORY):
+    return os.path.join(directory, topology_key(kind, params, seed) + '.npz')
+
+
+# saving the arrays atomically - other processes never see half written file
+def save_arrays(path, arrays):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            np.savez(file, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# topology for given kind, params and seed, generated only if it is not in the store yet
+# kind is 'fattree' (params: num_ports) or 'jellyfish' (params: num_servers, num_switches, num_ports)
+def load_topology(kind, params, seed=None, directory=DEFAULT_DIRECTORY):
+    path = topology_path(kind, params, seed, directory)
+    if os.path.exists(path):
+        with np.load(path) as arrays:
+            return CLASSES[kind].from_arrays(arrays)
+
+    topology = generate(kind, params, seed)
+    # without seed the topology is random, there is nothing to reuse it for
+    if seed is not None or kind == 'fattree':
+        save_arrays(path, topology.to_arrays())
+    return topology
+
+
+# saved arrays of the topology (generated and saved first if needed), for analyses that do not need Node objects
+def load_arrays(kind, params, seed=None, directory=DEFAULT_DIRECTORY):
+    path = topology_path(kind, params, seed, directory)
+    if not os.path.exists(path):
+        arrays = generate(kind, params, seed).to_arrays()
+        # random topology (no seed) is not saved, like in load_topology
+        if seed is None and kind != 'fattree':
+            return arrays
+        save_arrays(path, arrays)
+    with np.load(path) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+# CSR graph of switches straight from the saved arrays, its nodes are switch indices instead of Node objects
+def switch_csr(arrays):
+    num_switches = int(arrays['num_switches'])
+    links = arrays['links']
+    switch_links = (links[:, 0] < num_switches) & (links[:, 1] < num_switches)
+    return topo.CSRGraph(range(num_switches), links[switch_links], arrays['capacities'][switch_links],
+                         arrays['latencies'][switch_links])
+
+
+# index of the switch each server is connected to, straight from the saved arrays (servers are nodes after switches)
+def server_switches(arrays):
+    num_switches = int(arrays['num_switches'])
+    links = arrays['links']
+    links = links[(links[:, 0] >= num_switches) != (links[:, 1] >= num_switches)]
+    servers = np.maximum(links[:, 0], links[:, 1]) - num_switches
+    switches = np.zeros(len(arrays['ids']) - num_switches, dtype=np.int32)
+    switches[servers] = np.minimum(links[:, 0], links[:, 1])
+    return switches
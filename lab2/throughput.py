@@ -0,0 +1,208 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Fluid (flow level) throughput of a topology for a server traffic matrix. Every flow is split into subflows, one
+# per path of its routing (shortest path, N-way ECMP or k shortest paths), and subflows get max-min fair rates by
+# progressive filling: rates of all unfrozen subflows grow together until some resource (a direction of a switch
+# link, or the link of the source or destination server) is full, then subflows using it are frozen.
+# Subflows and resources are kept as a sparse incidence (pairs of resource and subflow ids), so each filling step
+# is a few numpy operations over it.
+
+import heapq
+import numpy as np
+
+import topo
+import traffic
+
+ROUTINGS = ('shortest', 'ecmp', 'ksp')
+
+
+# paths (lists of arc arrays) for each of the switch pairs (array of shape (n, 2))
+# routing is 'shortest' (one shortest path), 'ecmp' (up to num_paths equal cost paths) or 'ksp' (num_paths
+# shortest paths by Yen's algorithm), a pair of the same switch has one empty path
+# shortest and ecmp paths are picked at random from all equal cost paths (like hashing), seed makes it repeatable
+def path_sets(csr, pairs, routing='ecmp', num_paths=8, seed=0):
+    if routing not in ROUTINGS:
+        raise ValueError('unknown routing: ' + str(routing))
+    result = [None] * len(pairs)
+    order = np.argsort(pairs[:, 0], kind='stable')
+    sources, starts = np.unique(pairs[order, 0], return_index=True)
+    trees = {}
+    rng = np.random.default_rng(seed)
+    for source, group in zip(sources.tolist(), np.split(order, starts[1:])):
+        targets = pairs[group, 1].tolist()
+        if routing == 'ksp':
+            found = topo.ksp_from_source(csr, source, [target for target in targets if target != source], num_paths,
+                                         trees)
+        else:
+            dag = topo.ShortestPathDAG(csr, source)
+            limit = 1 if routing == 'shortest' else num_paths
+            found = {target: dag.sample_paths(target, limit, rng) for target in targets if target != source}
+        for idx, target in zip(group.tolist(), targets):
+            if target == source:
+                result[idx] = [np.zeros(0, dtype=np.int64)]
+            else:
+                result[idx] = [np.array(path['arcs'], dtype=np.int64) for path in found[target]]
+    return result
+
+
+# concatenation of ranges [starts[i], starts[i] + lengths[i]) as one array
+def expand_ranges(starts, lengths):
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+# max-min fair rates of subflows, entry i of the incidence says subflow subflows[i] uses resource resources[i]
+# every subflow has to use at least one resource, capacities are indexed by resource id
+# All unfrozen subflows have the same rate (the water level), so resource r gets full at level
+# (capacity - load of its frozen subflows) / number of its unfrozen subflows. Levels of the resources are kept in a
+# heap, we take the lowest one, freeze its subflows at that level and recompute levels only of the resources the
+# frozen subflows use, so every entry of the incidence is visited a constant number of times.
+def max_min_rates(resources, subflows, capacities, num_subflows):
+    capacities = np.asarray(capacities, dtype=np.float64)
+    num_resources = len(capacities)
+    tolerance = 1e-9 * max(float(capacities.max(initial=0)), 1.0)
+
+    # the incidence grouped by resource and grouped by subflow
+    resource_counts = np.bincount(resources, minlength=num_resources)
+    resource_offsets = np.cumsum(resource_counts) - resource_counts
+    resource_subflows = subflows[np.argsort(resources, kind='stable')]
+    subflow_counts = np.bincount(subflows, minlength=num_subflows)
+    subflow_offsets = np.cumsum(subflow_counts) - subflow_counts
+    subflow_resources = resources[np.argsort(subflows, kind='stable')]
+
+    users = resource_counts.astype(np.float64)
+    frozen_load = np.zeros(num_resources)
+    levels = np.full(num_resources, np.inf)
+    used = np.flatnonzero(resource_counts)
+    levels[used] = capacities[used] / users[used]
+    done = np.zeros(num_resources, dtype=bool)
+    frozen = np.zeros(num_subflows, dtype=bool)
+    rates = np.zeros(num_subflows)
+    heap = list(zip(levels[used].tolist(), used.tolist()))
+    heapq.heapify(heap)
+
+    while heap:
+        level, resource = heapq.heappop(heap)
+        if done[resource] or level != levels[resource]:
+            continue
+        # resources that get full at (almost) the same level are saturated together
+        batch = [resource]
+        while heap and heap[0][0] <= level + tolerance:
+            other_level, other = heapq.heappop(heap)
+            if not done[other] and other_level == levels[other]:
+                batch.append(other)
+        batch = np.array(batch)
+        done[batch] = True
+
+        candidates = resource_subflows[expand_ranges(resource_offsets[batch], resource_counts[batch])]
+        candidates = np.unique(candidates[~frozen[candidates]])
+        if not len(candidates):
+            continue
+        frozen[candidates] = True
+        rates[candidates] = level
+
+        # resources of the frozen subflows lose users and carry their load from now on
+        touched, counts = np.unique(subflow_resources[expand_ranges(subflow_offsets[candidates],
+                                                                    subflow_counts[candidates])], return_counts=True)
+        users[touched] -= counts
+        frozen_load[touched] += counts * level
+        touched = touched[~done[touched]]
+        levels[touched] = np.where(users[touched] > 0,
+                                   (capacities[touched] - frozen_load[touched]) / np.maximum(users[touched], 1),
+                                   np.inf)
+        for new_level, other in zip(levels[touched].tolist(), touched.tolist()):
+            if new_level != np.inf:
+                heapq.heappush(heap, (new_level, other))
+    return rates
+
+
+# max-min fair throughput of the traffic matrix (src, dst arrays of servers) in the topology given as switch CSR
+# graph and server_switches (switch of every server). link_capacities are indexed by link id of the CSR graph
+# (both directions of a link have the full capacity, default - capacities of the CSR graph), every server link
+# has server_capacity (default - the default link capacity, evaluate_topology takes it from the topology).
+# Returns dict with rates of the flows, their mean and minimum and mean normalized by server_capacity.
+def evaluate(csr, server_switches, src, dst, routing='ecmp', num_paths=8, link_capacities=None,
+             server_capacity=None, seed=0):
+    num_servers = len(server_switches)
+    pairs = np.stack((server_switches[src], server_switches[dst]), axis=1)
+    pairs, pair_of_flow = np.unique(pairs, axis=0, return_inverse=True)
+    pair_of_flow = pair_of_flow.reshape(-1)
+    paths = path_sets(csr, pairs, routing, num_paths, seed)
+
+    # all paths in one array of arcs, paths of pair p are path ids path_start[p]..path_start[p] + num_pair_paths[p]
+    num_pair_paths = np.array([len(pair_paths) for pair_paths in paths], dtype=np.int64)
+    path_start = np.cumsum(num_pair_paths) - num_pair_paths
+    flat_paths = [path for pair_paths in paths for path in pair_paths]
+    path_length = np.array([len(path) for path in flat_paths], dtype=np.int64)
+    path_offset = np.cumsum(path_length) - path_length
+    path_arcs = np.concatenate(flat_paths) if flat_paths else np.zeros(0, dtype=np.int64)
+
+    # one subflow for every path of the flow's switch pair
+    flow_num_paths = num_pair_paths[pair_of_flow]
+    if (flow_num_paths == 0).any():
+        raise ValueError('some flows have no path between their switches')
+    subflow_flow = np.repeat(np.arange(len(src)), flow_num_paths)
+    subflow_path = expand_ranges(path_start[pair_of_flow], flow_num_paths)
+    num_subflows = len(subflow_flow)
+
+    # resources: arcs of the switch graph, then uplinks of the servers, then downlinks of the servers
+    num_arcs = csr.num_arcs
+    arc_entries = expand_ranges(path_offset[subflow_path], path_length[subflow_path])
+    subflow_ids = np.arange(num_subflows)
+    resources = np.concatenate((path_arcs[arc_entries], num_arcs + np.asarray(src)[subflow_flow],
+                                num_arcs + num_servers + np.asarray(dst)[subflow_flow]))
+    subflows = np.concatenate((np.repeat(subflow_ids, path_length[subflow_path]), subflow_ids, subflow_ids))
+
+    if link_capacities is None:
+        link_capacities = csr.capacities
+    if server_capacity is None:
+        server_capacity = topo.DEFAULT_CAPACITY
+    capacities = np.concatenate((np.asarray(link_capacities, dtype=np.float64)[csr.link_of],
+                                 np.full(2 * num_servers, server_capacity, dtype=np.float64)))
+
+    rates = max_min_rates(resources, subflows, capacities, num_subflows)
+    flow_rates = np.bincount(subflow_flow, rates, minlength=len(src))
+    return {
+        'rates': flow_rates,
+        'mean': float(flow_rates.mean()) if len(flow_rates) else 0.0,
+        'min': float(flow_rates.min()) if len(flow_rates) else 0.0,
+        'normalized': float(flow_rates.mean() / server_capacity) if len(flow_rates) else 0.0,
+    }
+
+
+# throughput of the whole topology object, servers are indexed in order of topology.servers
+def evaluate_topology(topology, src, dst, routing='ecmp', num_paths=8, **options):
+    options.setdefault('server_capacity', topology.server_capacity())
+    return evaluate(topology.to_csr(), topology.server_switches(), src, dst, routing, num_paths, **options)
+
+
+if __name__ == "__main__":
+    import store
+
+    # fat tree and jellyfish built from the same equipment (k = 14), under random permutation traffic
+    num_ports = 14
+    num_servers = int((num_ports ** 3) / 4)
+    num_switches = int(num_ports * num_ports * 5 / 4)
+    topologies = {
+        'fattree': store.load_topology('fattree', (num_ports,)),
+        'jellyfish': store.load_topology('jellyfish', (num_servers, num_switches, num_ports), seed=0),
+    }
+    for name, topology in topologies.items():
+        src, dst = traffic.random_permutation(len(topology.servers), seed=0)
+        for routing, num_paths in (('shortest', 1), ('ecmp', 8), ('ecmp', 64), ('ksp', 8)):
+            result = evaluate_topology(topology, src, dst, routing, num_paths)
+            print('%-10s %-8s %2d paths: normalized throughput %.3f (min flow %.3f Mbit/s)'
+                  % (name, routing, num_paths, result['normalized'], result['min']))
@@ -14,47 +14,279 @@
 # under the License.
 
 import random
-import queue
+import heapq
+import json
+from array import array
+from collections import deque
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import math
+import numpy as np
 
 
 # region Edge
-# Class for an edge in the graph
+# default link parameters: capacity in Mbit/s and latency in ms (what mininet TCLink takes as bw and delay)
+DEFAULT_CAPACITY = 15.0
+DEFAULT_LATENCY = 5.0
+# metrics the routing can optimize on, see link_cost
+METRICS = ('hops', 'latency', 'capacity')
+
+
+# cost of links (numbers or arrays of their capacities and latencies) for the metric, 'capacity' cost is the
+# default capacity over the capacity of the link (like OSPF cost), so faster links are cheaper
+def link_cost(capacity, latency, metric='hops'):
+    if metric == 'hops':
+        return np.ones_like(np.asarray(capacity, dtype=np.float64))
+    if metric == 'latency':
+        return latency
+    if metric == 'capacity':
+        return DEFAULT_CAPACITY / capacity
+    raise ValueError('unknown metric: ' + str(metric))
+
+
+# Link profile gives parameters of links by their kind - types of the two nodes in sorted order joined by '-',
+# e.g. {'h-p_sw': {'capacity': 10, 'latency': 0.5}, 'c_sw-p_sw': {'capacity': 40}}, kinds and values that are
+# missing get the defaults. Generators set capacity and latency of every link they create from the profile.
+def link_kind(node1, node2):
+    return '-'.join(sorted((node1.type, node2.type)))
+
+
+# (capacity, latency) of links of the kind
+def link_parameters(profile, kind):
+    entry = (profile or {}).get(kind, {})
+    return float(entry.get('capacity', DEFAULT_CAPACITY)), float(entry.get('latency', DEFAULT_LATENCY))
+
+
+# link profile from a JSON file with the dict described above
+def load_profile(filename):
+    with open(filename) as file:
+        return json.load(file)
+
+
+# key of a node in the link store - its index in switches (even keys) or servers (odd keys) of its topology
+def node_key(node):
+    return 2 * node.index + (node.type == 'h')
+
+
+# Links of a topology are kept in flat arrays (endpoints as node keys, capacities and latencies) indexed by link id
+# instead of one object per link. Removed links get -1 endpoints, so ids of the other links never change and the
+# order of links stays the order they were added in. Edges of a node are grouped by an index built from the arrays
+# on first use after the links changed.
+class LinkStore:
+    def __init__(self, topology):
+        self.topology = topology
+        self.lkeys = array('i')
+        self.rkeys = array('i')
+        self.capacities = array('d')
+        self.latencies = array('d')
+        self.index = None
+
+    def add(self, node1, node2, capacity=DEFAULT_CAPACITY, latency=DEFAULT_LATENCY):
+        self.lkeys.append(node_key(node1))
+        self.rkeys.append(node_key(node2))
+        self.capacities.append(capacity)
+        self.latencies.append(latency)
+        node1.store = node2.store = self
+        self.index = None
+        return Edge(self, len(self.lkeys) - 1)
+
+    def remove(self, link):
+        self.lkeys[link] = self.rkeys[link] = -1
+        self.index = None
+
+    # node of the topology with the key, None for the endpoints of removed links
+    def node(self, key):
+        if key < 0:
+            return None
+        return (self.topology.servers if key & 1 else self.topology.switches)[key >> 1]
+
+    # ids of the links that were not removed (numpy array, in the order they were added)
+    def ids(self):
+        return np.flatnonzero(np.array(self.lkeys, dtype=np.int32) >= 0)
+
+    # endpoints of the links (array of shape (n, 2) of node keys, default - all links that were not removed)
+    def ends(self, links=None):
+        links = self.ids() if links is None else np.asarray(links, dtype=np.int64)
+        return np.stack((np.array(self.lkeys, dtype=np.int32)[links], np.array(self.rkeys, dtype=np.int32)[links]),
+                        axis=1).reshape(-1, 2)
+
+    # links grouped by their endpoints - offsets by node key, link ids and keys of the other endpoints, built again
+    # whenever the links changed since the last call
+    def grouped(self):
+        if self.index is None:
+            links = self.ids()
+            ends = self.ends(links)
+            keys = ends.T.ravel()
+            others = ends[:, ::-1].T.ravel()
+            links = np.concatenate((links, links))
+            order = np.lexsort((links, keys))
+            offsets = np.zeros(int(keys.max(initial=-1)) + 2, dtype=np.int64)
+            np.cumsum(np.bincount(keys, minlength=len(offsets) - 1), out=offsets[1:])
+            # python arrays are faster to read item by item than numpy ones
+            self.index = tuple(array('q', values.astype(np.int64).tobytes())
+                               for values in (offsets, links[order], others[order]))
+        return self.index
+
+    # edges of the node in the order they were added
+    def edges(self, node):
+        offsets, links, _ = self.grouped()
+        key = node_key(node)
+        if key + 1 >= len(offsets):
+            return []
+        return [Edge(self, link) for link in links[offsets[key]:offsets[key + 1]]]
+
+    # nodes on the other side of the edges of the node, in the same order
+    def neighbors(self, node):
+        offsets, _, others = self.grouped()
+        key = node_key(node)
+        if key + 1 >= len(offsets):
+            return []
+        switches, servers = self.topology.switches, self.topology.servers
+        return [servers[other >> 1] if other & 1 else switches[other >> 1]
+                for other in others[offsets[key]:offsets[key + 1]]]
+
+
+# Edge in the graph is a view of one link of the LinkStore, created when edges are read, so nodes and links do not
+# need objects of their own. Link parameters can be changed through the view.
 class Edge:
-    def __init__(self):
-        self.lnode = None
-        self.rnode = None
+    __slots__ = ('store', 'link')
+
+    def __init__(self, store, link):
+        self.store = store
+        self.link = link
+
+    def __eq__(self, other):
+        return isinstance(other, Edge) and self.store is other.store and self.link == other.link
+
+    def __hash__(self):
+        return hash((id(self.store), self.link))
+
+    @property
+    def lnode(self):
+        return self.store.node(self.store.lkeys[self.link])
+
+    @property
+    def rnode(self):
+        return self.store.node(self.store.rkeys[self.link])
+
+    @property
+    def capacity(self):
+        return self.store.capacities[self.link]
+
+    @capacity.setter
+    def capacity(self, capacity):
+        self.store.capacities[self.link] = capacity
+
+    @property
+    def latency(self):
+        return self.store.latencies[self.link]
+
+    @latency.setter
+    def latency(self, latency):
+        self.store.latencies[self.link] = latency
+
+    # the endpoint of the edge on the other side than node
+    def other(self, node):
+        store = self.store
+        key = store.lkeys[self.link]
+        if key == node_key(node):
+            key = store.rkeys[self.link]
+        return store.node(key)
 
     def remove(self):
-        self.lnode.edges.remove(self)
-        self.rnode.edges.remove(self)
-        self.lnode = None
-        self.rnode = None
+        self.store.remove(self.link)
 
 
 # endregion
 
 # region Node
-# Class for a node in the graph
+# dotted address 'a.b.c.d' packed into one integer and back
+def dotted_to_int(address):
+    a, b, c, d = address.split('.')
+    return (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+
+
+def int_to_dotted(address):
+    return '%d.%d.%d.%d' % (address >> 24, (address >> 16) & 255, (address >> 8) & 255, address & 255)
+
+
+# address from its four octets, octets can be ints or arrays
+def pack_address(a, b, c, d):
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+
+# vectorized dotted_to_int - array of dotted strings to array of addresses (uint32). The strings are viewed as
+# fixed width bytes and every column of characters is added to the octet its preceding dots point to.
+def dotted_to_ints(addresses):
+    chars = np.asarray(addresses, dtype='S15')
+    chars = chars.view(np.uint8).reshape(len(chars), 15)
+    octet = np.cumsum(chars == ord('.'), axis=1)
+    is_digit = (chars >= ord('0')) & (chars <= ord('9'))
+    octets = np.zeros((len(chars), 4), dtype=np.uint32)
+    rows = np.arange(len(chars))
+    for column in range(15):
+        digits = is_digit[:, column]
+        row, part = rows[digits], octet[digits, column]
+        octets[row, part] = octets[row, part] * 10 + (chars[digits, column] - ord('0'))
+    return pack_address(octets[:, 0], octets[:, 1], octets[:, 2], octets[:, 3])
+
+
+# vectorized int_to_dotted - array of addresses to array of dotted strings
+def ints_to_dotted(addresses):
+    addresses = np.asarray(addresses, dtype=np.uint32)
+    octets = [np.char.mod('%d', (addresses >> shift) & 255) for shift in (24, 16, 8, 0)]
+    result = octets[0]
+    for octet in octets[1:]:
+        result = np.char.add(np.char.add(result, '.'), octet)
+    return result
+
+
+# Class for a node in the graph. Nodes have slots instead of a __dict__, dotted ids (fattree addresses) are kept
+# packed in an integer and turned into the string only when id is read. index is the position of the node in
+# switches or servers list of its topology (-1 if it does not belong to any), store is the LinkStore of the
+# topology once the node has links, edges are read from it.
+# With dotted=True the id is an already packed address (no string is parsed).
 class Node:
-    def __init__(self, id, type):
-        self.edges = []
-        self.id = id
-        self.type = type
-
-    # Add an edge connected to another node
-    def add_edge(self, node):
-        edge = Edge()
-        edge.lnode = self
-        edge.rnode = node
-        self.edges.append(edge)
-        node.edges.append(edge)
-        return edge
+    __slots__ = ('store', 'address', 'dotted', 'type', 'index')
 
-    # Remove an edge from the node
+    def __init__(self, id, type, index=-1, dotted=False):
+        self.store = None
+        if dotted:
+            self.address = id
+            self.dotted = True
+        else:
+            self.id = id
+        self.type = type
+        self.index = index
+
+    @property
+    def id(self):
+        return int_to_dotted(self.address) if self.dotted else self.address
+
+    @id.setter
+    def id(self, id):
+        self.dotted = isinstance(id, str) and id.count('.') == 3
+        self.address = dotted_to_int(id) if self.dotted else id
+
+    @property
+    def edges(self):
+        return self.store.edges(self) if self.store is not None else []
+
+    # nodes on the other side of the edges, in the order of edges
+    def neighbors(self):
+        return self.store.neighbors(self) if self.store is not None else []
+
+    # Add an edge connected to another node, one of the nodes has to have links in a topology already (or use
+    # Topology.add_link)
+    def add_edge(self, node, capacity=DEFAULT_CAPACITY, latency=DEFAULT_LATENCY):
+        store = self.store if self.store is not None else node.store
+        if store is None:
+            raise ValueError('nodes without a topology can not be connected')
+        return store.add(self, node, capacity, latency)
+
+    # Remove an edge of the node
     def remove_edge(self, edge):
-        self.edges.remove(edge)
+        edge.remove()
 
     # Decide if another node is a neighbor
     def is_neighbor(self, node):
@@ -70,203 +302,562 @@ class Node:
         return None
 
 
+# endregion
+
+# region CSR
+# Compact integer indexed view of a graph (compressed sparse row format), built next to the Node objects.
+# Nodes are mapped to indices 0..n-1 in the order they are given, neighbors of node i are stored in
+# targets[offsets[i]:offsets[i + 1]]. Every slot of targets is one direction of a link (an arc), so slot
+# positions can be used as dense directed link ids, link_of maps each slot to its undirected link in links.
+# capacities and latencies of the links are kept as arrays indexed by link id.
+class CSRGraph:
+    # links can be given as pairs of indices when the topology already keeps them (with their capacities and
+    # latencies, defaults if not given), otherwise they are collected from the edges of the nodes
+    def __init__(self, vertices, links=None, capacities=None, latencies=None):
+        self.nodes = list(vertices)
+        self.index = {node: idx for idx, node in enumerate(self.nodes)}
+        self.num_nodes = len(self.nodes)
+
+        if links is None:
+            # we collect each undirected link once (from the endpoint with lower index)
+            # links to nodes outside of vertices are skipped, so we get induced subgraph
+            links = []
+            capacities = []
+            latencies = []
+            for idx, node in enumerate(self.nodes):
+                for edge in node.edges:
+                    other_idx = self.index.get(edge.other(node))
+                    if other_idx is not None and idx < other_idx:
+                        links.append((idx, other_idx))
+                        capacities.append(edge.capacity)
+                        latencies.append(edge.latency)
+        self.links = np.array(links, dtype=np.int32).reshape(-1, 2)
+        self.num_links = len(self.links)
+        self.capacities = np.broadcast_to(np.asarray(DEFAULT_CAPACITY if capacities is None else capacities,
+                                                     dtype=np.float64), self.num_links).copy()
+        self.latencies = np.broadcast_to(np.asarray(DEFAULT_LATENCY if latencies is None else latencies,
+                                                    dtype=np.float64), self.num_links).copy()
+
+        # each link gives two arcs, we sort them by source node to get the CSR layout
+        link_ids = np.arange(self.num_links, dtype=np.int32)
+        arc_src = np.concatenate((self.links[:, 0], self.links[:, 1]))
+        arc_dst = np.concatenate((self.links[:, 1], self.links[:, 0]))
+        order = np.argsort(arc_src, kind='stable')
+        degrees = np.bincount(arc_src, minlength=self.num_nodes)
+
+        self.offsets = np.zeros(self.num_nodes + 1, dtype=np.int64)
+        np.cumsum(degrees, out=self.offsets[1:])
+        self.sources = arc_src[order]
+        self.targets = arc_dst[order]
+        self.link_of = np.concatenate((link_ids, link_ids))[order]
+        self.num_arcs = len(self.targets)
+        # arc going in the opposite direction (both arcs of a link are next to each other when sorted by link)
+        self.reverse = np.empty(self.num_arcs, dtype=np.int64)
+        by_link = np.argsort(self.link_of, kind='stable')
+        self.reverse[by_link[0::2]] = by_link[1::2]
+        self.reverse[by_link[1::2]] = by_link[0::2]
+        self.cached_lists = None
+
+    # the arrays as plain python lists (computed once), faster for searches visiting nodes one by one
+    def lists(self):
+        if self.cached_lists is None:
+            self.cached_lists = (self.offsets.tolist(), self.sources.tolist(), self.targets.tolist(),
+                                 self.link_of.tolist())
+        return self.cached_lists
+
+    # cost of every arc (array indexed by arc id) for the metric, see link_cost
+    def arc_costs(self, metric='hops'):
+        return link_cost(self.capacities, self.latencies, metric)[self.link_of]
+
+    # arc ids of all arcs leaving any of the nodes (numpy array), grouped by node in the given order
+    def arcs_of(self, nodes):
+        starts = self.offsets[nodes]
+        counts = self.offsets[np.asarray(nodes) + 1] - starts
+        total = int(counts.sum())
+        # position of each arc inside its group is added to the start of the group
+        group_starts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return group_starts + np.arange(total)
+
+    def degree(self, idx):
+        return int(self.offsets[idx + 1] - self.offsets[idx])
+
+    # neighbors of the node as a view into targets array, no copying
+    def neighbors(self, idx):
+        return self.targets[self.offsets[idx]:self.offsets[idx + 1]]
+
+    # arc (slot) ids of all arcs leaving the node
+    def arcs(self, idx):
+        return range(int(self.offsets[idx]), int(self.offsets[idx + 1]))
+
+    def is_neighbor(self, idx1, idx2):
+        return bool(np.any(self.neighbors(idx1) == idx2))
+
+    # arc id of the arc going from idx1 to idx2, -1 if nodes are not connected
+    def find_arc(self, idx1, idx2):
+        hits = np.flatnonzero(self.neighbors(idx1) == idx2)
+        if len(hits) == 0:
+            return -1
+        return int(self.offsets[idx1] + hits[0])
+
+    # translating list of indices (e.g. a path) back to Node objects
+    def to_nodes(self, indices):
+        return [self.nodes[idx] for idx in indices]
+
+    def to_indices(self, nodes):
+        return [self.index[node] for node in nodes]
+
+
+# endregion
+
+# region Topology
+# plots of big topologies get labels only on every n-th node, so that there are at most this many labels
+MAX_LABELS = 200
+
+
+# Common part of Jellyfish and Fattree, both keep lists of servers and switches (Node objects) and their links in
+# a LinkStore
+class Topology:
+
+    # integer indexed (CSR) view of the topology, switches first and then servers (if requested). It is built from
+    # the link arrays, with links ordered as CSRGraph collects them from the edges of the nodes (by the endpoint
+    # with lower index, then in the order they were added), so both give the same graph.
+    def to_csr(self, with_servers=False):
+        links = self.link_ids()
+        ends = self.link_array(links)
+        if not with_servers:
+            keep = (ends < len(self.switches)).all(axis=1)
+            links, ends = links[keep], ends[keep]
+        low, high = ends.min(axis=1), ends.max(axis=1)
+        order = np.argsort(low, kind='stable')
+        capacities = np.array(self.link_store.capacities)[links[order]]
+        latencies = np.array(self.link_store.latencies)[links[order]]
+        vertices = self.switches + self.servers if with_servers else self.switches
+        return CSRGraph(vertices, np.stack((low[order], high[order]), axis=1), capacities, latencies)
+
+    # number of servers connected to each switch, in order of self.switches
+    def servers_per_switch(self):
+        return np.bincount(self.server_switches(), minlength=len(self.switches)).astype(np.int64)
+
+    # index of the switch (in order of self.switches) each server is connected to, in order of self.servers
+    def server_switches(self):
+        ends = self.link_store.ends()
+        ends = ends[(ends[:, 0] & 1) != (ends[:, 1] & 1)]
+        switches = np.full(len(self.servers), -1, dtype=np.int32)
+        switches[ends.max(axis=1) >> 1] = ends.min(axis=1) >> 1
+        return switches
+
+    # capacity of the server links, they are all of one kind, so the profile gives them the same capacity
+    def server_capacity(self):
+        return self.servers[0].edges[0].capacity if self.servers else DEFAULT_CAPACITY
+
+    # position of each node in switches + servers, from the index of the node in its own list
+    def node_position(self, node):
+        return node.index + len(self.switches) if node.type == 'h' else node.index
+
+    # connecting two nodes by a link with parameters from the link profile of the topology
+    def add_link(self, node1, node2):
+        return self.link_store.add(node1, node2, *link_parameters(self.profile, link_kind(node1, node2)))
+
+    # ids of all links in the LinkStore, in the order they were added
+    def link_ids(self):
+        return self.link_store.ids()
+
+    # every edge once, in the order the links were added
+    def link_edges(self):
+        return [Edge(self.link_store, link) for link in self.link_ids().tolist()]
+
+    # links (ids, default all) or edges as pairs of indices of lnode and rnode, nodes are indexed switches first
+    # and then servers
+    def link_array(self, links=None):
+        if links is not None and len(links) and isinstance(links[0], Edge):
+            links = [edge.link for edge in links]
+        keys = self.link_store.ends(links)
+        return ((keys >> 1) + (keys & 1) * len(self.switches)).astype(np.int32)
+
+    # setting index of every node to its position in switches and servers lists
+    def number_nodes(self):
+        for nodes in (self.switches, self.servers):
+            for idx, node in enumerate(nodes):
+                node.index = idx
+
+    # drawing the topology with nodes at positions (array of shape (n, 2) over switches and then servers, in the
+    # unit square). All links are one LineCollection and all nodes one scatter, so it takes a few matplotlib calls
+    # for any size. labels is True (all), False (none) or 'auto' (at most MAX_LABELS, every n-th node),
+    # the figure is saved as filename + '.' + fmt ('png' or 'svg') or shown.
+    def render(self, positions, figsize, filename, save=False, labels='auto', fmt='png', server_label_rotation=0):
+        fig, ax = plt.subplots(figsize=figsize)
+        links = self.link_array()
+        ax.add_collection(LineCollection(positions[links], colors='black', linewidths=0.5, zorder=1))
+
+        num_switches = len(self.switches)
+        colors = np.array(['black'] * num_switches + ['red'] * len(self.servers))
+        ax.scatter(positions[:, 0], positions[:, 1], s=30, c='white', edgecolors=colors, zorder=2)
+
+        if labels:
+            nodes = self.switches + self.servers
+            step = 1 if labels is True else max(1, math.ceil(len(nodes) / MAX_LABELS))
+            for idx in range(0, len(nodes), step):
+                rotation = server_label_rotation if idx >= num_switches else 0
+                ax.annotate(nodes[idx].id, xy=positions[idx], rotation=rotation, ha='center', va='center',
+                            bbox=dict(boxstyle="round", fc="w", color=colors[idx]), zorder=3)
+
+        ax.set_xlim(0, 1)
+        ax.set_ylim(0, 1)
+        if save:
+            fig.savefig(filename + '.' + fmt, format=fmt)
+        else:
+            plt.show()
+        plt.close(fig)
+
+    # topology as a dict of numpy arrays (used for saving it to disk), nodes are indexed switches first and then
+    # servers, links are pairs of indices of lnode and rnode of each edge in the order the links were added
+    def to_arrays(self):
+        nodes = self.switches + self.servers
+        links = self.link_ids()
+        return {
+            'num_ports': np.array(self.num_ports),
+            'num_switches': np.array(len(self.switches)),
+            'ids': np.array([node.address for node in nodes]),
+            'dotted': np.array([node.dotted for node in nodes]),
+            'types': np.array([node.type for node in nodes]),
+            'links': self.link_array(links),
+            'capacities': np.array(self.link_store.capacities)[links],
+            'latencies': np.array(self.link_store.latencies)[links],
+            'profile': np.array(json.dumps(self.profile)),
+            'servers_per_switch': self.servers_per_switch(),
+        }
+
+    # creating topology back from the arrays returned by to_arrays, without generating it again
+    @classmethod
+    def from_arrays(cls, arrays):
+        topology = cls.__new__(cls)
+        topology.__setstate__(arrays)
+        return topology
+
+    # topologies are pickled (e.g. sent to worker processes) as their arrays, much smaller and faster than the
+    # Node objects
+    def __getstate__(self):
+        return self.to_arrays()
+
+    def __setstate__(self, arrays):
+        self.num_ports = int(arrays['num_ports'])
+        num_switches = int(arrays['num_switches'])
+        nodes = [Node(id, type, idx if idx < num_switches else idx - num_switches, dotted)
+                 for idx, (id, type, dotted) in enumerate(zip(arrays['ids'].tolist(), arrays['types'].tolist(),
+                                                              arrays['dotted'].tolist()))]
+        # the arrays of the store are filled at once, keys follow from the positions
+        self.link_store = LinkStore(self)
+        positions = arrays['links'].astype(np.int64)
+        keys = np.where(positions < num_switches, 2 * positions, 2 * (positions - num_switches) + 1)
+        self.link_store.lkeys.frombytes(keys[:, 0].astype(np.int32).tobytes())
+        self.link_store.rkeys.frombytes(keys[:, 1].astype(np.int32).tobytes())
+        self.link_store.capacities.frombytes(arrays['capacities'].astype(np.float64).tobytes())
+        self.link_store.latencies.frombytes(arrays['latencies'].astype(np.float64).tobytes())
+        for node in nodes:
+            node.store = self.link_store
+        self.profile = json.loads(str(arrays['profile']))
+        self.switches = nodes[:num_switches]
+        self.servers = nodes[num_switches:]
+        self.restore(arrays)
+
+    # restoring topology specific state in from_arrays
+    def restore(self, arrays):
+        pass
+
+
 # endregion
 
 # region Jellyfish
-class Jellyfish:
+class Jellyfish(Topology):
 
-    def __init__(self, num_servers, num_switches, num_ports):
+    # seed makes the topology reproducible, with None it is different each time
+    # profile gives capacity and latency of links by their kind ('h-sw' and 'sw-sw'), see link_parameters
+    def __init__(self, num_servers, num_switches, num_ports, seed=None, profile=None):
         self.servers = []
         self.switches = []
         self.num_ports = num_ports
+        self.profile = profile
+        self.link_store = LinkStore(self)
+        self.random = random.Random(seed)
+        # state of the random graph between switches (indices of switches are their ids)
+        # open_ports - free ports of each switch, adjacent - set of neighbor switches of each switch
+        # links - list of connected pairs (lower index first), link_positions - position of each pair in links,
+        # so we can pick random link and remove it in O(1), store_links - id of each pair in the link store
+        self.open_ports = []
+        self.adjacent = []
+        self.links = []
+        self.link_positions = {}
+        self.store_links = []
+        # hop counts between switches, computed on first use by switch_distances and kept up to date by expand
+        self.distances = None
         self.generate(num_servers, num_switches)
 
     # function creating jellyfish topology following the paper
     def generate(self, num_servers, num_switches):
 
-        switches = []
-        open_ports = []
         # Adding switches to topology, incremental id-s.
         for i in range(num_switches):
-            switch = Node(i, 'sw')
-            switches.append(switch)
+            self.switches.append(Node(i, 'sw', i))
             # Setting counter of open ports for this switch to num_ports
-            open_ports.append(self.num_ports)
+            self.open_ports.append(self.num_ports)
+            self.adjacent.append(set())
 
-        # Adding servers to topology
-        servers = []
+        # Adding servers to topology, connecting each server to one switch evenly
         for i in range(num_servers):
-            host = Node(i, 'h')
-            # Connecting each server to one switch evenly
-            switch = switches[i % num_switches]
-            host.add_edge(switch)
-            # Server was connected to switch, so we decrease number of open ports on switch
-            open_ports[i % num_switches] -= 1
-            servers.append(host)
-
-        links = []
-        switch_idx_list = [n for n in range(num_switches)]
-        # We create list of all combinations of switches pairs from the set
-        switch_idx_pairs = [(a, b) for idx, a in enumerate(switch_idx_list) for b in switch_idx_list[idx + 1:]]
-        # We keep track how many more switches need to be connected
-        switch_left = num_switches
-
-        while switch_left > 1 and switch_idx_pairs:
-            # Picking random pair of switches
-            pair = random.choice(switch_idx_pairs)
-            # If both switches have still some open ports we connect them
-            if open_ports[pair[0]] > 0 and open_ports[pair[1]] > 0:
-                sw1 = switches[pair[0]]
-                sw2 = switches[pair[1]]
-                sw1.add_edge(sw2)
-                # Storing created link
-                links.append((pair[0], pair[1]))
-                links.append((pair[1], pair[0]))
-                # Decreasing number of open ports on both switches
-                open_ports[pair[0]] -= 1
-                open_ports[pair[1]] -= 1
-                # If on sw1/sw2 we run out of ports we decrease number of switch_left to be connected
-                if open_ports[pair[0]] == 0:
-                    switch_left -= 1
-                if open_ports[pair[1]] == 0:
-                    switch_left -= 1
-                # Removing pair from list, switches already connected or do not have open ports
-                switch_idx_pairs.remove(pair)
-            else:
-                switch_idx_pairs.remove(pair)
+            self.add_server(i % num_switches)
+
+        # We keep list of switches that still have open ports, so we only draw from switches we can connect
+        free = [idx for idx in range(num_switches) if self.open_ports[idx] > 0]
+        free_positions = {idx: pos for pos, idx in enumerate(free)}
+        failures = 0
+        while len(free) > 1:
+            # Picking random pair of switches with open ports
+            sw1, sw2 = self.random.sample(free, 2)
+            if sw2 in self.adjacent[sw1]:
+                # switches are already connected, when it happens too often we check if any pair is still possible
+                failures += 1
+                if failures > 2 * len(free) + 10:
+                    if not self.connectable_pair_exists(free):
+                        break
+                    failures = 0
+                continue
+            failures = 0
+            self.connect(sw1, sw2)
+            # If on sw1/sw2 we run out of ports we remove it from switches to be connected
+            # (the last switch takes its place, so removal is O(1))
+            for idx in (sw1, sw2):
+                if self.open_ports[idx] == 0:
+                    pos = free_positions.pop(idx)
+                    last = free.pop()
+                    if pos < len(free):
+                        free[pos] = last
+                        free_positions[last] = pos
 
         # after connecting random pairs of switches there still might be switches not utilized (having more than 1
         # open port)
-        while self.not_utilized_switches_exists(open_ports, num_switches):
-            for idx, switch3 in enumerate(switches):
-                if open_ports[idx] > 1:
-                    pair_idx_1 = idx
-                    pair_idx_2 = idx
-                    old_edge = None
-                    # we look for a pair of switches that are is connected but is not our neighbour (like in the paper)
-                    while pair_idx_1 == idx or pair_idx_2 == idx or (idx, pair_idx_1) in links or (
-                            idx, pair_idx_2) in links or old_edge is None:
-                        pair = random.choice(links)
-                        pair_idx_1 = pair[0]
-                        pair_idx_2 = pair[1]
-                        sw1 = switches[pair_idx_1]
-                        sw2 = switches[pair_idx_2]
-                        old_edge = sw1.find_edge(sw2)
-                    # we found a pair, so as in the paper we remove the pair's link and connect to those switches
-                    sw1.remove_edge(old_edge)
-                    sw2.remove_edge(old_edge)
-                    links.remove((pair_idx_1, pair_idx_2))
-                    links.remove((pair_idx_2, pair_idx_1))
-
-                    sw1.add_edge(switch3)
-                    sw2.add_edge(switch3)
-                    links.append((pair_idx_1, idx))
-                    links.append((idx, pair_idx_1))
-                    links.append((pair_idx_2, idx))
-                    links.append((idx, pair_idx_2))
-                    # so we utilized 2 ports on our switch
-                    open_ports[idx] -= 2
-
-        self.servers.extend(servers)
-        self.switches.extend(switches)
-
-    @staticmethod
-    def not_utilized_switches_exists(open_ports, num_switches):
-        # simply iterate open_ports list and stop when not utilized switch found
         for idx in range(num_switches):
-            if open_ports[idx] > 1:
-                return True
+            self.fill_open_ports(idx)
+
+    # besides the graph we keep open ports and state of the random generator, so expand continues the same way
+    def to_arrays(self):
+        arrays = Topology.to_arrays(self)
+        arrays['open_ports'] = np.array(self.open_ports, dtype=np.int32)
+        # order of links matters for random choice of the link to break
+        arrays['switch_links'] = np.array(self.links, dtype=np.int32).reshape(-1, 2)
+        arrays['random_state'] = np.array(self.random.getstate()[1], dtype=np.int64)
+        return arrays
+
+    def restore(self, arrays):
+        self.open_ports = arrays['open_ports'].tolist()
+        self.random = random.Random()
+        self.random.setstate((3, tuple(arrays['random_state'].tolist()), None))
+        self.adjacent = [set() for _ in self.switches]
+        self.links = [tuple(pair) for pair in arrays['switch_links'].tolist()]
+        self.link_positions = {pair: pos for pos, pair in enumerate(self.links)}
+        # links of the store are in the order of the arrays, switches are the first nodes
+        store_ids = {(min(pair), max(pair)): link for link, pair in enumerate(arrays['links'].tolist())
+                     if max(pair) < len(self.switches)}
+        self.store_links = [store_ids[pair] for pair in self.links]
+        self.distances = None
+        for idx1, idx2 in self.links:
+            self.adjacent[idx1].add(idx2)
+            self.adjacent[idx2].add(idx1)
+
+    # checks if there is a pair of not connected switches among the free ones
+    def connectable_pair_exists(self, free):
+        for pos, sw1 in enumerate(free):
+            for sw2 in free[pos + 1:]:
+                if sw2 not in self.adjacent[sw1]:
+                    return True
         return False
 
+    # like in the paper, while the switch has at least 2 open ports we remove random link between two switches
+    # that are not our neighbours and connect both of them to our switch, returns list of removed links
+    def fill_open_ports(self, idx):
+        removed = []
+        # we give up after many unsuccessful draws (possible only for very small topologies)
+        tries = 0
+        while self.open_ports[idx] > 1 and self.links and tries < 10 * len(self.links):
+            sw1, sw2 = self.random.choice(self.links)
+            if idx in (sw1, sw2) or sw1 in self.adjacent[idx] or sw2 in self.adjacent[idx]:
+                tries += 1
+                continue
+            tries = 0
+            # we found a pair, so as in the paper we remove the pair's link and connect to those switches
+            self.disconnect(sw1, sw2)
+            self.connect(sw1, idx)
+            self.connect(sw2, idx)
+            removed.append((sw1, sw2))
+        # one port is left when the switch has an odd number of them, it goes to a switch that also has a free port
+        if self.open_ports[idx] == 1:
+            free = [sw for sw in range(len(self.switches))
+                    if self.open_ports[sw] > 0 and sw != idx and sw not in self.adjacent[idx]]
+            if free:
+                self.connect(idx, self.random.choice(free))
+        return removed
+
+    # adding new server connected to the switch given by index
+    def add_server(self, idx):
+        host = Node(len(self.servers), 'h', len(self.servers))
+        self.add_link(host, self.switches[idx])
+        # Server was connected to switch, so we decrease number of open ports on switch
+        self.open_ports[idx] -= 1
+        self.servers.append(host)
+
+    # incremental expansion as described in the paper - each new switch gets its share of new servers and its
+    # remaining ports are filled by breaking random links between other switches. Without new switches servers
+    # are connected to the switches with most open ports. Cached distances are updated, not recomputed.
+    def expand(self, num_new_switches, num_new_servers):
+        # every new switch needs at least 2 ports left for links to other switches
+        if num_new_switches > 0 and -(-num_new_servers // num_new_switches) > self.num_ports - 2:
+            raise ValueError('new switches do not have enough ports for ' + str(num_new_servers) + ' servers')
+        if num_new_switches == 0 and num_new_servers > sum(self.open_ports):
+            raise ValueError('switches do not have enough open ports for ' + str(num_new_servers) + ' servers')
+
+        removed = []
+        for i in range(num_new_switches):
+            idx = len(self.switches)
+            self.switches.append(Node(idx, 'sw', idx))
+            self.open_ports.append(self.num_ports)
+            self.adjacent.append(set())
+            # servers are spread evenly, the first switches get one more if they do not divide
+            for _ in range(num_new_servers // num_new_switches + (i < num_new_servers % num_new_switches)):
+                self.add_server(idx)
+            removed.extend(self.fill_open_ports(idx))
+
+        if num_new_switches == 0:
+            for _ in range(num_new_servers):
+                self.add_server(max(range(len(self.switches)), key=lambda idx: self.open_ports[idx]))
+
+        if self.distances is not None and num_new_switches > 0:
+            self.update_distances(removed)
+
+    # hop counts between all pairs of switches (matrix indexed by switch index, -1 if unreachable)
+    def switch_distances(self):
+        if self.distances is None:
+            self.distances = all_pairs_hops(self.to_csr())
+        return self.distances
+
+    # updating cached distances after new switches (all after the ones in the cache) were added in place of
+    # removed links. Distances from a source can only grow if some endpoint of removed link lost all its links to
+    # the previous level of the BFS tree, we run BFS just from such sources (and from the new switches).
+    # For all other sources old distances stay valid and the only possible shortcuts go through new switches.
+    def update_distances(self, removed):
+        old = self.distances
+        num_old = len(old)
+        new_switches = np.arange(num_old, len(self.switches))
+
+        affected = np.zeros(num_old, dtype=bool)
+        # links of the old graph that are gone (links between new switches were never in the cache)
+        endpoints = set(sw for link in removed if max(link) < num_old for sw in link)
+        for idx in endpoints:
+            neighbors = [sw for sw in self.adjacent[idx] if sw < num_old]
+            parents = (old[:, neighbors] == old[:, [idx]] - 1).sum(axis=1)
+            affected |= (old[:, idx] > 0) & (parents == 0)
+        sources = np.concatenate((np.flatnonzero(affected), new_switches))
+        rows = multi_source_hops(self.to_csr(), sources)
+
+        # unreachable pairs get distance bigger than any path, so minimum works for them
+        unreachable = 2 * len(self.switches) + 1
+        via_new = rows[len(sources) - len(new_switches):]
+        via_new = np.where(via_new < 0, unreachable, via_new)
+        kept = np.flatnonzero(~affected)
+        kept_new = np.where(old[kept] < 0, unreachable, old[kept])
+        for row in via_new:
+            np.minimum(kept_new, row[kept][:, None] + row[None, :num_old], out=kept_new)
+
+        distances = np.empty((len(self.switches), len(self.switches)), dtype=np.int32)
+        distances[kept, :num_old] = np.where(kept_new >= unreachable, -1, kept_new)
+        distances[np.ix_(kept, new_switches)] = rows[len(sources) - len(new_switches):, kept].T
+        distances[sources] = rows
+        self.distances = distances
+
+    # switch graph is built straight from the list of links, without walking over the edges of the nodes,
+    # so all switch links have the parameters of the profile (edges changed afterwards need CSRGraph(switches))
+    def to_csr(self, with_servers=False):
+        if with_servers:
+            return Topology.to_csr(self, True)
+        capacity, latency = link_parameters(self.profile, 'sw-sw')
+        return CSRGraph(self.switches, self.links, capacity, latency)
+
+    # connecting two switches given by their indices
+    def connect(self, idx1, idx2):
+        edge = self.add_link(self.switches[idx1], self.switches[idx2])
+        self.adjacent[idx1].add(idx2)
+        self.adjacent[idx2].add(idx1)
+        self.open_ports[idx1] -= 1
+        self.open_ports[idx2] -= 1
+        pair = (min(idx1, idx2), max(idx1, idx2))
+        self.link_positions[pair] = len(self.links)
+        self.links.append(pair)
+        self.store_links.append(edge.link)
+
+    # removing link between two switches given by their indices
+    def disconnect(self, idx1, idx2):
+        self.adjacent[idx1].discard(idx2)
+        self.adjacent[idx2].discard(idx1)
+        self.open_ports[idx1] += 1
+        self.open_ports[idx2] += 1
+        # the last link takes the place of the removed one
+        pos = self.link_positions.pop((min(idx1, idx2), max(idx1, idx2)))
+        self.link_store.remove(self.store_links[pos])
+        last = self.links.pop()
+        last_link = self.store_links.pop()
+        if pos < len(self.links):
+            self.links[pos] = last
+            self.store_links[pos] = last_link
+            self.link_positions[last] = pos
+
     # method for plotting the jellyfish topology
-    def plot(self, save=False, mode=1):
-        # scaling figure depending num_ports
+    # servers are plotted on the outer circle and switches on the inner one, mode 1 spreads each of them
+    # over the whole circle, otherwise both use the same separation
+    def plot(self, save=False, mode=1, labels='auto', fmt='png'):
+        # scaling figure depending num_ports, big figures are not made bigger any more
         scale = 5 if self.num_ports > 6 else 3
-        fig, ax = plt.subplots(figsize=(self.num_ports * scale, self.num_ports * scale))
+        size = min(self.num_ports * scale, 40)
 
-        # Plotting servers, radius - we plot servers and switches on the circle
-        r = 0.45
-        server_ans = []
+        num_servers = len(self.servers)
+        num_switches = len(self.switches)
         if mode == 1:
             # choosing nodes separation in radians
-            alfa_base = alfa_scale = 2 * math.pi / len(self.servers)
-        else:
-            alfa_base = alfa_scale = 2 * math.pi / (max(len(self.servers), len(self.switches)))
-        for server in self.servers:
-            an = ax.annotate(server.id, xy=(r * math.cos(alfa_scale) + 0.5, r * math.sin(alfa_scale) + 0.5),
-                             bbox=dict(boxstyle="round", fc="w", color='red'))
-            alfa_scale = alfa_scale + alfa_base
-            server_ans.append(an)
-
-        # plotting switches on the inner circe, lesser radius
-        r = 0.35
-        switch_ans = []
-        if mode == 1:
-            alfa_base = alfa_scale = 2 * math.pi / len(self.switches)
-        else:
-            alfa_base = alfa_scale = 2 * math.pi / (max(len(self.servers), len(self.switches)))
-        for switch in self.switches:
-            an = ax.annotate(switch.id, xy=(r * math.cos(alfa_scale) + 0.5, r * math.sin(alfa_scale) + 0.5),
-                             bbox=dict(boxstyle="round", fc="w"))
-            alfa_scale = alfa_scale + alfa_base
-            switch_ans.append(an)
-
-        # now we plot edges, first from hosts to switches
-        plotted_edges = []
-        for server in self.servers:
-            for edge in server.edges:
-                switch = edge.rnode
-                server_idx = self.servers.index(server)
-                switch_idx = self.switches.index(switch)
-                server_an = server_ans[server_idx]
-                switch_an = switch_ans[switch_idx]
-                an = ax.annotate('', xy=(server_an.xy[0], server_an.xy[1]),
-                                 xytext=(switch_an.xy[0], switch_an.xy[1]),
-                                 arrowprops=dict(arrowstyle='-'))
-                plotted_edges.append(edge)
-
-        # now we plot edges between switches
-        for switch in self.switches:
-            for edge in switch.edges:
-                if edge not in plotted_edges:
-                    switch2 = edge.rnode
-                    switch_idx = self.switches.index(switch)
-                    switch2_idx = self.switches.index(switch2)
-                    sw1_an = switch_ans[switch_idx]
-                    sw2_an = switch_ans[switch2_idx]
-                    an = ax.annotate('', xy=(sw1_an.xy[0], sw1_an.xy[1]),
-                                     xytext=(sw2_an.xy[0], sw2_an.xy[1]),
-                                     arrowprops=dict(arrowstyle='-'))
-                    plotted_edges.append(edge)
-
-        # either save the plot or jus display
-        if save:
-            plt.savefig('fig_jellyfish_k' + str(self.num_ports) + '.png')
+            server_step = 2 * math.pi / num_servers
+            switch_step = 2 * math.pi / num_switches
         else:
-            plt.show()
-        plt.clf()
-        fig.clf()
+            server_step = switch_step = 2 * math.pi / max(num_servers, num_switches)
+        # radius 0.35 for switches and 0.45 for servers, nodes start one step after angle 0
+        angles = np.concatenate((switch_step * np.arange(1, num_switches + 1),
+                                 server_step * np.arange(1, num_servers + 1)))
+        radius = np.concatenate((np.full(num_switches, 0.35), np.full(num_servers, 0.45)))
+        positions = np.stack((radius * np.cos(angles) + 0.5, radius * np.sin(angles) + 0.5), axis=1)
+
+        self.render(positions, (size, size), 'fig_jellyfish_k' + str(self.num_ports), save, labels, fmt)
 
 
 # endregion
 
 # region Fattree
-class Fattree:
+class Fattree(Topology):
 
-    def __init__(self, num_ports):
+    # profile gives capacity and latency of links by their kind ('h-p_sw', 'p_sw-p_sw' and 'c_sw-p_sw'),
+    # see link_parameters
+    def __init__(self, num_ports, profile=None):
         self.servers = []
         self.switches = []
         self.num_ports = num_ports
+        self.profile = profile
+        self.link_store = LinkStore(self)
         self.generate()
 
-    # function creating fattree topology
+    # function creating fattree topology, nodes get their index (see switch_coordinates) when they are created, so
+    # links can be added to the link store before the switches are in self.switches
     def generate(self):
 
         # We start with core layer switches
         core_layer_switches = []
         for i in range(1, int(self.num_ports / 2 + 1)):
             for j in range(1, int(self.num_ports / 2 + 1)):
-                core_switch = Node(self.get_core_switch_id(i, j, self.num_ports), 'c_sw')
+                core_switch = Node(self.get_core_switch_id(i, j, self.num_ports), 'c_sw',
+                                   self.num_ports ** 2 + len(core_layer_switches), dotted=True)
                 core_layer_switches.append(core_switch)
 
         # in each pod we separate adding lower layer switches with hosts and upper layer switches
@@ -276,19 +867,19 @@ class Fattree:
 
             # creation of lower layer switches
             for i in range(int(self.num_ports / 2)):
-                switch = Node(self.get_pod_switch_id(pod_num, i), 'p_sw')
+                switch = Node(self.get_pod_switch_id(pod_num, i), 'p_sw', pod_num * self.num_ports + i, dotted=True)
                 lower_layer_switches.append(switch)
 
             # for each lower layer switch we create the hosts and connect them
             for i, switch in enumerate(lower_layer_switches):
                 for j in range(2, int(self.num_ports / 2 + 2)):
-                    host = Node(self.get_host_id(pod_num, i, j), 'h')
-                    host.add_edge(switch)
+                    host = Node(self.get_host_id(pod_num, i, j), 'h', len(self.servers), dotted=True)
+                    self.add_link(host, switch)
                     self.servers.append(host)
 
             # creating upper layer switches
             for i in range(int(self.num_ports / 2), self.num_ports):
-                switch = Node(self.get_pod_switch_id(pod_num, i), 'p_sw')
+                switch = Node(self.get_pod_switch_id(pod_num, i), 'p_sw', pod_num * self.num_ports + i, dotted=True)
                 upper_layer_switches.append(switch)
 
             # connecting upper layer switches with core layer switches
@@ -296,145 +887,277 @@ class Fattree:
                 # we calculate stride_num which indicate to which upper layer switch we connect the core switch
                 # stride_num is based on floor division - property of addressing in fattree
                 stride_num = int(i // (self.num_ports / 2))
-                core_layer_switches[i].add_edge(upper_layer_switches[stride_num])
+                self.add_link(core_layer_switches[i], upper_layer_switches[stride_num])
 
             # connecting switches in pod
             for lower in lower_layer_switches:
                 for upper in upper_layer_switches:
-                    lower.add_edge(upper)
+                    self.add_link(lower, upper)
 
             self.switches.extend(lower_layer_switches)
             self.switches.extend(upper_layer_switches)
 
         self.switches.extend(core_layer_switches)
 
-    # 3 utility functions for proper addressing of the nodes
+    # 3 utility functions for proper addressing of the nodes, addresses are packed into integers (arrays of
+    # numbers give arrays of addresses), node.id turns them into the dotted strings
     @staticmethod
     def get_pod_switch_id(pod_num, switch_num):
-        return '10.' + str(pod_num) + '.' + str(switch_num) + '.1'
+        return pack_address(10, pod_num, switch_num, 1)
 
     @staticmethod
     def get_core_switch_id(core_x, core_y, num_ports):
-        return '10.' + str(num_ports) + '.' + str(core_x) + '.' + str(core_y)
+        return pack_address(10, num_ports, core_x, core_y)
 
     @staticmethod
     def get_host_id(pod_num, switch_num, host_num):
-        return '10.' + str(pod_num) + '.' + str(switch_num) + '.' + str(host_num)
+        return pack_address(10, pod_num, switch_num, host_num)
+
+    # Hop distances in fattree follow from the addressing scheme, so we can get them without any graph search.
+    # Nodes are described by coordinates (layer, pod, column, sub): layer 0 - host, 1 - lower pod switch,
+    # 2 - upper pod switch, 3 - core switch. Column is the number of the lower switch for hosts and lower
+    # switches, and the group (switch_num - k/2 or core_x - 1) for upper and core switches. Sub tells apart
+    # nodes with the same position - host_num for hosts and core_y for core switches (pod is -1 for them).
+
+    # coordinates of hosts given by their index in self.servers (arrays of indices are accepted)
+    @staticmethod
+    def host_coordinates(num_ports, hosts):
+        half = num_ports // 2
+        hosts = np.asarray(hosts)
+        return 0, hosts // (half * half), (hosts // half) % half, hosts % half + 2
+
+    # coordinates of switches given by their index in self.switches (arrays of indices are accepted)
+    # in each pod there are k/2 lower switches followed by k/2 upper ones, core switches are at the end
+    @staticmethod
+    def switch_coordinates(num_ports, switches):
+        half = num_ports // 2
+        switches = np.asarray(switches)
+        is_core = switches >= num_ports * num_ports
+        core_num = switches - num_ports * num_ports
+        pod_pos = switches % num_ports
+        layer = np.where(is_core, 3, np.where(pod_pos < half, 1, 2))
+        pod = np.where(is_core, -1, switches // num_ports)
+        column = np.where(is_core, core_num // half, pod_pos % half)
+        sub = np.where(is_core, core_num % half + 1, 0)
+        return layer, pod, column, sub
+
+    # coordinates of nodes given by their packed addresses (arrays of addresses are accepted), read by bit operations
+    # core switches are 10.k.x.y, pod switches 10.pod.switch.1 and hosts 10.pod.switch.host with host >= 2
+    @staticmethod
+    def address_coordinates(num_ports, addresses):
+        half = num_ports // 2
+        addresses = np.asarray(addresses, dtype=np.int64)
+        second = (addresses >> 16) & 255
+        third = (addresses >> 8) & 255
+        fourth = addresses & 255
+        is_core = second == num_ports
+        is_host = ~is_core & (fourth > 1)
+        layer = np.where(is_core, 3, np.where(is_host, 0, np.where(third < half, 1, 2)))
+        pod = np.where(is_core, -1, second)
+        column = np.where(is_core, third - 1, np.where(layer == 2, third - half, third))
+        sub = np.where(is_core | is_host, fourth, 0)
+        return layer, pod, column, sub
+
+    # coordinates of a single node read from its address
+    @staticmethod
+    def node_coordinates(num_ports, node):
+        return tuple(int(coordinate) for coordinate in Fattree.address_coordinates(num_ports, node.address))
+
+    # packed addresses of the nodes (e.g. topology.servers) as an array
+    @staticmethod
+    def addresses(nodes):
+        return np.fromiter((node.address for node in nodes), dtype=np.int64, count=len(nodes))
+
+    # vectorized hop distance between two sets of nodes given by coordinates, hosts are replaced by their
+    # lower switch (one hop further), the rest is case analysis of the layers of the two switches
+    @staticmethod
+    def coordinates_distance(coordinates1, coordinates2):
+        layer1, pod1, column1, sub1, layer2, pod2, column2, sub2 = np.broadcast_arrays(*coordinates1, *coordinates2)
+        same_node = (layer1 == layer2) & (pod1 == pod2) & (column1 == column2) & (sub1 == sub2)
+        extra = (layer1 == 0).astype(np.int64) + (layer2 == 0)
+        # order switches so that low has the lower layer
+        low = np.minimum(np.maximum(layer1, 1), np.maximum(layer2, 1))
+        high = np.maximum(layer1, layer2)
+        same_pod = pod1 == pod2
+        same_column = column1 == column2
+
+        conditions = [
+            (low == 1) & (high <= 1),
+            (low == 1) & (high == 2),
+            (low == 1) & (high == 3),
+            (low == 2) & (high == 2),
+            (low == 2) & (high == 3),
+        ]
+        choices = [
+            # lower - lower (hosts on the same switch meet here), through upper switch of the pod or through core
+            np.where(same_pod, np.where(same_column, 0, 2), 4),
+            # lower - upper, directly in the pod or through core to the same group in other pod
+            np.where(same_pod, 1, 3),
+            # lower - core, through upper switch of the group
+            2,
+            # upper - upper, in the same pod through lower switch, same group through core
+            np.where(same_pod | same_column, 2, 4),
+            # upper - core, directly in the group or through lower switch and upper switch of the group
+            np.where(same_column, 1, 3),
+        ]
+        # core - core, through upper switch of the group or core - upper - lower - upper - core
+        distance = np.select(conditions, choices, np.where(same_column, 2, 4)) + extra
+        return np.where(same_node, 0, distance)
+
+    # hop distance between hosts given by index in self.servers, O(1) per pair
+    @staticmethod
+    def host_distance(num_ports, hosts1, hosts2):
+        return Fattree.coordinates_distance(Fattree.host_coordinates(num_ports, hosts1),
+                                            Fattree.host_coordinates(num_ports, hosts2))
+
+    # hop distance between switches given by index in self.switches, O(1) per pair
+    @staticmethod
+    def switch_distance(num_ports, switches1, switches2):
+        return Fattree.coordinates_distance(Fattree.switch_coordinates(num_ports, switches1),
+                                            Fattree.switch_coordinates(num_ports, switches2))
+
+    # hop distance between any two nodes of the fattree, based only on their addresses
+    @staticmethod
+    def distance(num_ports, node1, node2):
+        return int(Fattree.coordinates_distance(Fattree.node_coordinates(num_ports, node1),
+                                                Fattree.node_coordinates(num_ports, node2)))
+
+    # histogram of path lengths between all unordered pairs of servers (same format as path_length_histogram)
+    # every server has k/2 - 1 servers on the same switch, (k/2 - 1) * k/2 in the same pod and
+    # (k - 1) * (k/2)^2 in other pods, at distance 2, 4 and 6
+    @staticmethod
+    def path_length_distribution(num_ports):
+        half = num_ports // 2
+        num_servers = num_ports * half * half
+        histogram = np.zeros(7, dtype=np.int64)
+        histogram[2] = num_servers * (half - 1) // 2
+        histogram[4] = num_servers * (half - 1) * half // 2
+        histogram[6] = num_servers * (num_ports - 1) * half * half // 2
+        return histogram
 
     # func for plotting fattree topo
-    def plot(self, save=False):
-        # scaling the plot based on num_ports
+    # servers are plotted at the bottom, core switches at the top and pod switches in two layers between them
+    def plot(self, save=False, labels='auto', fmt='png'):
+        # scaling the plot based on num_ports, big figures are not made bigger any more
         scale = 5 if self.num_ports > 6 else 3
-        fig, ax = plt.subplots(figsize=(self.num_ports * scale * 2, self.num_ports * scale))
-
-        # plotting servers first
-        server_ans = []
-        # setting separation of nodes on the plot (bottom of teh plot)
-        x_base = x_scale = 1 / (len(self.servers) + 1)
-        for server in self.servers:
-            an = ax.annotate(server.id, xy=(0.0 + x_scale, 0.05), bbox=dict(boxstyle="round", fc="w", color='red'),
-                             rotation=90)
-            x_scale = x_scale + x_base
-            server_ans.append(an)
-
-        # plotting core switches (top of the plot)
-        core_ans = []
-        core_switches = [switch for switch in self.switches if switch.type == 'c_sw']
-        x_base = x_scale = 1 / (len(core_switches) + 1)
-        for switch in core_switches:
-            an = ax.annotate(switch.id, xy=(0.0 + x_scale, 0.95), bbox=dict(boxstyle="round", fc="w"))
-            x_scale = x_scale + x_base
-            core_ans.append(an)
-
-        lower_pod_ans = []
-        upper_pod_ans = []
-        # selecting pod switches from all switches to simplify plotting
-        pod_switches = [switch for switch in self.switches if switch.type == 'p_sw']
-        # list of values used to filter lower/upper pod switches - based on num_ports
-        modulo_values = [n for n in range(int(self.num_ports / 2))]
-        # 2 lists, of lower and upper pod switches
-        lower_pod_switches = [switch for idx, switch in enumerate(pod_switches) if
-                              idx % self.num_ports in modulo_values]
-        upper_pod_switches = [switch for switch in pod_switches if switch not in lower_pod_switches]
-        x_base = x_scale = 1 / (len(lower_pod_switches) + 1)
-
-        # plotting lower layer
-        for switch in lower_pod_switches:
-            an = ax.annotate(switch.id, xy=(0.0 + x_scale, 0.4), bbox=dict(boxstyle="round", fc="w"))
-            x_scale = x_scale + x_base
-            lower_pod_ans.append(an)
-
-        # plotting upper layer
-        x_scale = x_base
-        for switch in upper_pod_switches:
-            an = ax.annotate(switch.id, xy=(0.0 + x_scale, 0.6), bbox=dict(boxstyle="round", fc="w"))
-            x_scale = x_scale + x_base
-            upper_pod_ans.append(an)
-
-        # plotting edges between hosts and lower layer switches
-        plotted_edges = []
-        for server in self.servers:
-            for edge in server.edges:
-                switch = edge.rnode
-                server_idx = self.servers.index(server)
-                switch_idx = lower_pod_switches.index(switch)
-                # we use stored annotations plotted to use their location for plotting edges
-                server_an = server_ans[server_idx]
-                switch_an = lower_pod_ans[switch_idx]
-                an = ax.annotate('', xy=(server_an.xy[0], server_an.xy[1]),
-                                 xytext=(switch_an.xy[0], switch_an.xy[1]),
-                                 arrowprops=dict(arrowstyle='-'))
-                plotted_edges.append(edge)
-
-        # plotting edges between core switches and upper layer switches
-        for core_switch in core_switches:
-            for edge in core_switch.edges:
-                pod_switch = edge.rnode
-                core_switch_idx = core_switches.index(core_switch)
-                pod_switch_idx = upper_pod_switches.index(pod_switch)
-                core_an = core_ans[core_switch_idx]
-                pod_an = upper_pod_ans[pod_switch_idx]
-                an = ax.annotate('', xy=(core_an.xy[0], core_an.xy[1]),
-                                 xytext=(pod_an.xy[0], pod_an.xy[1]),
-                                 arrowprops=dict(arrowstyle='-'))
-                plotted_edges.append(edge)
-
-        # plotting edges between switches in pods
-        for upper_switch in upper_pod_switches:
-            for edge in upper_switch.edges:
-                if edge not in plotted_edges:
-                    lower_switch = edge.lnode
-                    upper_switch_idx = upper_pod_switches.index(upper_switch)
-                    lower_switch_idx = lower_pod_switches.index(lower_switch)
-                    upper_an = upper_pod_ans[upper_switch_idx]
-                    lower_an = lower_pod_ans[lower_switch_idx]
-                    an = ax.annotate('', xy=(upper_an.xy[0], upper_an.xy[1]),
-                                     xytext=(lower_an.xy[0], lower_an.xy[1]),
-                                     arrowprops=dict(arrowstyle='-'))
-                    plotted_edges.append(edge)
+        size = min(self.num_ports * scale, 40)
 
-        if save:
-            plt.savefig('fig_fattree_k' + str(self.num_ports) + '.png')
-        else:
-            plt.show()
-        plt.clf()
-        fig.clf()
+        # layer of each switch: pod switches come in groups of num_ports per pod, lower (edge) switches first
+        is_core = np.array([switch.type == 'c_sw' for switch in self.switches])
+        pod_position = np.cumsum(~is_core) - 1
+        is_lower = ~is_core & (pod_position % self.num_ports < self.num_ports // 2)
+        is_upper = ~is_core & ~is_lower
 
+        positions = np.zeros((len(self.switches) + len(self.servers), 2))
+        switch_positions = positions[:len(self.switches)]
+        # nodes of each layer are spread evenly, in the order of self.switches / self.servers
+        for layer, y in ((is_core, 0.95), (is_upper, 0.6), (is_lower, 0.4)):
+            switch_positions[layer, 0] = np.arange(1, layer.sum() + 1) / (layer.sum() + 1)
+            switch_positions[layer, 1] = y
+        positions[len(self.switches):, 0] = np.arange(1, len(self.servers) + 1) / (len(self.servers) + 1)
+        positions[len(self.switches):, 1] = 0.05
 
-# endregion
+        self.render(positions, (size * 2, size), 'fig_fattree_k' + str(self.num_ports), save, labels, fmt,
+                    server_label_rotation=90)
 
-# region Prioritize
 
-# utility class used for priority queue, in python3.x it is not possible to use priority queue
-# with not comparable items and not unique priority values
-class Prioritize(object):
-    def __init__(self, priority, object):
-        self.priority = priority
-        self.object = object
+# endregion
 
-    # our own comparator function
-    def __lt__(self, other):
-        return self.priority < other.priority
+# region Bitsets
+
+# number of set bits in each row of packed uint64 bitsets
+def popcount_rows(words):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int64)
+    return np.unpackbits(words.view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+
+# frontier BFS from many sources at once, sources are packed as bits of uint64 words
+# bit b of row v is set when node v was reached from sources[b], so one OR of neighbor rows advances the
+# search of all sources by one hop. It yields (level, new) for each level, new has the bits of the nodes reached
+# exactly at that level. Links marked in banned_links (bool array indexed by link id) are skipped.
+def bitset_bfs(csr, sources, banned_links=None):
+    sources = np.asarray(sources, dtype=np.int64)
+    num_words = (len(sources) + 63) // 64
+    bit_pos = np.arange(len(sources))
+
+    arc_sources = csr.sources
+    arc_targets = csr.targets
+    if banned_links is not None:
+        keep = ~np.asarray(banned_links, dtype=bool)[csr.link_of]
+        arc_sources = arc_sources[keep]
+        arc_targets = arc_targets[keep]
+    # arcs are grouped by source node, so neighbors of each node are one segment for reduceat
+    # empty segments (nodes without links) are left out, they never get new bits from neighbors
+    has_arcs = np.flatnonzero(np.bincount(arc_sources, minlength=csr.num_nodes))
+    segment_starts = np.searchsorted(arc_sources, has_arcs)
+
+    seen = np.zeros((csr.num_nodes, num_words), dtype=np.uint64)
+    np.bitwise_or.at(seen, (sources, bit_pos // 64), np.left_shift(np.uint64(1), (bit_pos % 64).astype(np.uint64)))
+    frontier = seen.copy()
+    level = 0
+    yield level, frontier
+
+    while len(arc_targets):
+        level += 1
+        reached = np.zeros_like(seen)
+        reached[has_arcs] = np.bitwise_or.reduceat(frontier[arc_targets], segment_starts, axis=0)
+        frontier = reached & ~seen
+        if not frontier.any():
+            return
+        seen |= frontier
+        yield level, frontier
+
+
+# hop counts from each of the sources to every node, matrix[i][v] is distance from sources[i] to v (-1 if
+# unreachable). It runs bitset_bfs on batches of sources, so memory stays bounded for big graphs.
+def multi_source_hops(csr, sources, banned_links=None, batch=4096):
+    sources = np.asarray(sources, dtype=np.int64)
+    matrix = np.full((len(sources), csr.num_nodes), -1, dtype=np.int32)
+    for start in range(0, len(sources), batch):
+        part = sources[start:start + batch]
+        for level, new in bitset_bfs(csr, part, banned_links):
+            bits = np.unpackbits(new.view(np.uint8), axis=1, bitorder='little')[:, :len(part)]
+            node_idx, source_idx = np.nonzero(bits)
+            matrix[start + source_idx, node_idx] = level
+    return matrix
+
+
+# histogram of server pair path lengths (in hops, server links included), hosts[v] is the number of servers
+# connected to node v. Unordered server pairs are counted, histogram[2] includes servers on the same switch.
+# Each switch pair is weighted by its servers, so servers are never enumerated.
+def path_length_histogram(csr, hosts, batch=4096):
+    hosts = np.asarray(hosts, dtype=np.int64)
+    sources = np.flatnonzero(hosts)
+    histogram = np.zeros(3, dtype=np.int64)
+    # pairs of servers sharing the switch - path server -> switch -> server
+    histogram[2] = int((hosts * (hosts - 1) // 2).sum())
+
+    for start in range(0, len(sources), batch):
+        part = sources[start:start + batch]
+        # source bits are grouped by number of servers, so weighted count is a few masked popcounts
+        masks = []
+        bit_pos = np.arange(len(part))
+        for count in np.unique(hosts[part]):
+            mask = np.zeros((len(part) + 63) // 64, dtype=np.uint64)
+            selected = bit_pos[hosts[part] == count]
+            np.bitwise_or.at(mask, selected // 64, np.left_shift(np.uint64(1), (selected % 64).astype(np.uint64)))
+            masks.append((int(count), mask))
+
+        for level, new in bitset_bfs(csr, part):
+            if level == 0:
+                continue
+            rows = new[sources]
+            weighted = np.zeros(len(sources), dtype=np.int64)
+            for count, mask in masks:
+                weighted += count * popcount_rows(rows & mask)
+            if level + 2 >= len(histogram):
+                histogram = np.concatenate((histogram, np.zeros(level + 3 - len(histogram), dtype=np.int64)))
+            # ordered pairs of servers, each unordered pair is counted from both sides
+            histogram[level + 2] += int((hosts[sources] * weighted).sum())
+
+    histogram[3:] //= 2
+    return histogram
 
 
 # endregion
@@ -442,47 +1165,136 @@ class Prioritize(object):
 # region Dijkstra
 
 # implementation of dijkstra algorithm, from starting node to every other in graph
-def dijkstra(start_vertex, vertices):
+# without weight function all links cost 1, so the search is a plain BFS, otherwise weight(edge) gives the cost
+# of the link and we run dijkstra with binary heap, both walk only over the edges of the visited nodes
+# weight can be also name of a metric (see link_cost), then costs come from capacity and latency of the edges
+def dijkstra(start_vertex, vertices, weight=None):
+    if isinstance(weight, str):
+        weight = edge_weight(weight)
     # sets for saving the results
     # result - for costs of paths to each node
     # previous - for previous step - used later for reproducing paths
-    result = {}
-    previous = {}
-
     # we start with setting distance to each node as 'infinity'
-    for switch in vertices:
-        result[switch] = float('inf')
+    result = dict.fromkeys(vertices, float('inf'))
+    previous = {}
     # distance to where we are is 0
     result[start_vertex] = 0
-    # list to store already visited nodes
-    visited = []
-
-    # we initialize the priority queue, used to put possible paths from current node
-    p_queue = queue.PriorityQueue()
-    p_queue.put(Prioritize(0, start_vertex))
-
-    # we run the algorith until we vae possible move (node in the queue)
-    while not p_queue.empty():
-        # we get next hop from queue and mark it as visited
-        current_vertex = p_queue.get().object
-        visited.append(current_vertex)
-
-        for neighbor in vertices:
-            if current_vertex.is_neighbor(neighbor):
-                # we do not have weights (or path bandwidth) so we set 1 as cost of reaching next hop
-                distance = 1
-                # for each of reachable nodes, if one hasn't been visited yet we go there
-                if neighbor not in visited:
-                    old_cost = result[neighbor]
-                    new_cost = result[current_vertex] + distance
-                    # if we have reached the node cheaper than before - save the path
-                    if new_cost < old_cost:
-                        p_queue.put(Prioritize(new_cost, neighbor))
-                        result[neighbor] = new_cost
-                        previous[neighbor] = current_vertex
+
+    if weight is None:
+        # BFS - first time we reach the node is the cheapest one
+        frontier = deque([start_vertex])
+        while frontier:
+            current_vertex = frontier.popleft()
+            new_cost = result[current_vertex] + 1
+            for neighbor in current_vertex.neighbors():
+                # nodes outside of vertices are not in result, so we skip them
+                if result.get(neighbor, 0) == float('inf'):
+                    result[neighbor] = new_cost
+                    previous[neighbor] = current_vertex
+                    frontier.append(neighbor)
+        return result, previous
+
+    # set to store already visited nodes
+    visited = set()
+    # heap of (cost, counter, node) - counter breaks ties, so nodes are never compared
+    counter = 0
+    p_queue = [(0, counter, start_vertex)]
+
+    # we run the algorithm until we have possible move (node in the queue)
+    while p_queue:
+        cost, _, current_vertex = heapq.heappop(p_queue)
+        # stale entry, the node was already reached cheaper
+        if current_vertex in visited:
+            continue
+        visited.add(current_vertex)
+
+        for edge, neighbor in zip(current_vertex.edges, current_vertex.neighbors()):
+            if neighbor in visited or neighbor not in result:
+                continue
+            new_cost = cost + weight(edge)
+            # if we have reached the node cheaper than before - save the path
+            if new_cost < result[neighbor]:
+                result[neighbor] = new_cost
+                previous[neighbor] = current_vertex
+                counter += 1
+                heapq.heappush(p_queue, (new_cost, counter, neighbor))
     return result, previous
 
 
+# weight function of edges for the metric, None for hops (dijkstra runs BFS then)
+def edge_weight(metric):
+    if metric not in METRICS:
+        raise ValueError('unknown metric: ' + str(metric))
+    if metric == 'hops':
+        return None
+    return lambda edge: link_cost(edge.capacity, edge.latency, metric)
+
+
+# BFS over the CSR graph, level by level with numpy - returns arrays of hop counts (-1 if not reachable) and
+# of previous nodes (-1 for source and unreachable nodes), same contract as dijkstra but for node indices
+def bfs(csr, source):
+    dist = np.full(csr.num_nodes, -1, dtype=np.int32)
+    previous = np.full(csr.num_nodes, -1, dtype=np.int32)
+    dist[source] = 0
+    frontier = np.array([source], dtype=np.int32)
+    level = 0
+
+    while len(frontier):
+        level += 1
+        arcs = csr.arcs_of(frontier)
+        arcs = arcs[dist[csr.targets[arcs]] < 0]
+        reached = csr.targets[arcs]
+        # node reached by several arcs keeps one of them, any is a valid shortest path step
+        dist[reached] = level
+        previous[reached] = csr.sources[arcs]
+        frontier = np.flatnonzero(dist == level)
+    return dist, previous
+
+
+# dijkstra over the CSR graph, weights is array of costs indexed by arc id (e.g. csr.arc_costs('latency'))
+def dijkstra_csr(csr, source, weights):
+    dist = np.full(csr.num_nodes, np.inf)
+    previous = np.full(csr.num_nodes, -1, dtype=np.int32)
+    visited = np.zeros(csr.num_nodes, dtype=bool)
+    offsets = csr.offsets.tolist()
+    targets = csr.targets.tolist()
+    weights = np.asarray(weights, dtype=float).tolist()
+    dist[source] = 0
+    p_queue = [(0.0, source)]
+
+    while p_queue:
+        cost, current = heapq.heappop(p_queue)
+        if visited[current]:
+            continue
+        visited[current] = True
+        for arc in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[arc]
+            new_cost = cost + weights[arc]
+            if not visited[neighbor] and new_cost < dist[neighbor]:
+                dist[neighbor] = new_cost
+                previous[neighbor] = current
+                heapq.heappush(p_queue, (new_cost, neighbor))
+    return dist, previous
+
+
+# hop counts between all pairs of nodes of the CSR graph, matrix[i][j] is distance from i to j (-1 if unreachable)
+def all_pairs_hops(csr):
+    return multi_source_hops(csr, np.arange(csr.num_nodes))
+
+
+# path (list of indices) from the previous array returned by bfs or dijkstra_csr, empty list if not reachable
+def get_path_csr(previous, start_idx, end_idx):
+    path = [end_idx]
+    while path[-1] != start_idx:
+        prev = int(previous[path[-1]])
+        if prev < 0:
+            return []
+        path.append(prev)
+    # we traversed the path backwards, so reverse the list
+    path.reverse()
+    return path
+
+
 # utility function for printing the shortest path calculated in dijkstra algorithm
 def print_path(previous, start_node, end_node):
     node = end_node
@@ -516,8 +1328,8 @@ def get_path(previous, start_node, end_node):
 
 
 # utility function for getting the path between two nodes, it executes the dijkstra algorithm
-def dijkstra_get_path(start_vertex, end_node, vertices):
-    distance, previous = dijkstra(start_vertex, vertices)
+def dijkstra_get_path(start_vertex, end_node, vertices, weight=None):
+    distance, previous = dijkstra(start_vertex, vertices, weight)
 
     # it is possible that path between two nodes does not exist!
     if distance[end_node] == float('inf'):
@@ -535,72 +1347,314 @@ def dijkstra_get_path(start_vertex, end_node, vertices):
     return distance[end_node], path
 
 
+# endregion
+
+# region ECMP
+
+# DAG of all shortest (in hops) paths from the source, built with one BFS. Arc u -> v is in the DAG if
+# dist[v] == dist[u] + 1, counts[v] is the number of shortest paths from the source to v (computed level by level,
+# so O(E) in total). Paths to any node can be enumerated lazily, without running Yen's algorithm.
+class ShortestPathDAG:
+    def __init__(self, csr, source):
+        self.csr = csr
+        self.source = source
+        self.dist, _ = bfs(csr, source)
+        dist_sources = self.dist[csr.sources]
+        self.in_dag = (dist_sources >= 0) & (self.dist[csr.targets] == dist_sources + 1)
+
+        self.counts = np.zeros(csr.num_nodes, dtype=np.int64)
+        self.counts[source] = 1
+        dag_arcs = np.flatnonzero(self.in_dag)
+        dag_levels = self.dist[csr.targets[dag_arcs]]
+        for level in range(1, int(self.dist.max()) + 1):
+            arcs = dag_arcs[dag_levels == level]
+            np.add.at(self.counts, csr.targets[arcs], self.counts[csr.sources[arcs]])
+        # plain lists for the path walks, which visit nodes one by one
+        self.dist_list = self.dist.tolist()
+        self.counts_list = self.counts.tolist()
+
+    # number of equal cost (shortest) paths to the target
+    def num_paths(self, target):
+        return int(self.counts[target])
+
+    # generator of shortest paths to the target {'cost', 'path', 'arcs'} (like ksp_yen_csr), at most max_paths
+    # we walk back from the target over arcs to nodes one level closer to the source
+    def paths(self, target, max_paths=None):
+        if self.dist[target] < 0 or max_paths == 0:
+            return
+        offsets, sources, targets, link_of = self.csr.lists()
+        dist = self.dist_list
+        reverse = self.csr.reverse
+        found = 0
+        # stack of (node, arcs from the node to the target)
+        stack = [(target, [])]
+        while stack:
+            node, arcs = stack.pop()
+            if node == self.source:
+                yield {'cost': len(arcs), 'path': [self.source] + [targets[arc] for arc in arcs], 'arcs': arcs}
+                found += 1
+                if found == max_paths:
+                    return
+                continue
+            for arc in range(offsets[node + 1] - 1, offsets[node] - 1, -1):
+                if dist[targets[arc]] == dist[node] - 1:
+                    stack.append((targets[arc], [int(reverse[arc])] + arcs))
+
+    # shortest path to the target with the given rank (0..num_paths - 1), in the same order as paths yields them
+    # at every node we skip whole subtrees of paths by their counts, so it takes one walk back from the target
+    def path(self, target, rank):
+        offsets, sources, targets, link_of = self.csr.lists()
+        dist = self.dist_list
+        counts = self.counts_list
+        node = target
+        arcs = []
+        while node != self.source:
+            for arc in range(offsets[node], offsets[node + 1]):
+                previous = targets[arc]
+                if dist[previous] == dist[node] - 1:
+                    if rank < counts[previous]:
+                        break
+                    rank -= counts[previous]
+            arcs.append(int(self.csr.reverse[arc]))
+            node = previous
+        arcs.reverse()
+        return {'cost': len(arcs), 'path': [self.source] + [targets[arc] for arc in arcs], 'arcs': arcs}
+
+    # up to max_paths different shortest paths to the target picked uniformly at random (rng is numpy Generator),
+    # like ECMP hashing flows over all equal cost paths, ordered by rank
+    def sample_paths(self, target, max_paths, rng):
+        total = self.num_paths(target)
+        if total <= max_paths:
+            return list(self.paths(target))
+        ranks = np.sort(rng.choice(total, max_paths, replace=False))
+        return [self.path(target, int(rank)) for rank in ranks]
+
+    # for every arc, number of shortest paths from source of this DAG to the target that go over it
+    # target_dag is the DAG built from the target (graph is undirected, so it counts paths from arc to target)
+    def arc_path_counts(self, target_dag):
+        csr = self.csr
+        target = target_dag.source
+        on_path = (self.dist[csr.sources] >= 0) & (target_dag.dist[csr.targets] >= 0) & (
+                self.dist[csr.sources] + 1 + target_dag.dist[csr.targets] == self.dist[target])
+        return np.where(on_path, self.counts[csr.sources] * target_dag.counts[csr.targets], 0)
+
+
 # endregion
 
 # region Yen
-def ksp_yen(vertices, node_start, node_end, max_k):
-    distances, previous = dijkstra(node_start, vertices)
 
-    # Shortest path from the source to the target
-    A = [{'cost': distances[node_end],
-          'path': get_path(previous, node_start, node_end)}]
-    # Initialize the heap to store the potential k-th shortest path
-    B = queue.PriorityQueue()
+# shortest (in hops) path between two nodes of the CSR graph that avoids banned nodes and links, BFS stops as
+# soon as the target is reached. Returns the path as list of nodes and list of arcs ([], [] if not reachable)
+def spur_path(csr, source, target, banned_nodes=(), banned_links=()):
+    if source == target:
+        return [source], []
+    offsets, sources, targets, link_of = csr.lists()
+    previous_arc = {source: -1}
+    frontier = deque([source])
+
+    while frontier:
+        current = frontier.popleft()
+        for arc in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[arc]
+            if neighbor in previous_arc or neighbor in banned_nodes or link_of[arc] in banned_links:
+                continue
+            previous_arc[neighbor] = arc
+            if neighbor == target:
+                # we go back from the target to get the arcs of the path
+                arcs = []
+                while neighbor != source:
+                    arcs.append(previous_arc[neighbor])
+                    neighbor = sources[arcs[-1]]
+                arcs.reverse()
+                return [source] + [targets[arc] for arc in arcs], arcs
+            frontier.append(neighbor)
+    return [], []
+
+
+# cheapest path between two nodes of the CSR graph by arc costs (list indexed by arc id), like spur_path but
+# with dijkstra that stops when the target is taken from the heap
+def weighted_spur_path(csr, source, target, costs, banned_nodes=(), banned_links=()):
+    if source == target:
+        return [source], []
+    offsets, sources, targets, link_of = csr.lists()
+    dist = {source: 0.0}
+    previous_arc = {source: -1}
+    done = set()
+    p_queue = [(0.0, source)]
+
+    while p_queue:
+        cost, current = heapq.heappop(p_queue)
+        if current in done:
+            continue
+        if current == target:
+            arcs = []
+            while current != source:
+                arcs.append(previous_arc[current])
+                current = sources[arcs[-1]]
+            arcs.reverse()
+            return [source] + [targets[arc] for arc in arcs], arcs
+        done.add(current)
+        for arc in range(offsets[current], offsets[current + 1]):
+            neighbor = targets[arc]
+            if neighbor in done or neighbor in banned_nodes or link_of[arc] in banned_links:
+                continue
+            new_cost = cost + costs[arc]
+            if new_cost < dist.get(neighbor, float('inf')):
+                dist[neighbor] = new_cost
+                previous_arc[neighbor] = arc
+                heapq.heappush(p_queue, (new_cost, neighbor))
+    return [], []
+
+
+# Yen's algorithm on the CSR graph, the graph is never modified - links and nodes removed for the spur search
+# are passed as banned sets, so the same graph can be shared by many searches (and processes)
+# returns list of up to max_k paths {'cost', 'path', 'arcs'} ordered by cost, path is a list of node indices
+# paths are the shortest by the metric (see link_cost), hops use BFS for the spur paths, other metrics dijkstra
+def ksp_yen_csr(csr, source, target, max_k, metric='hops'):
+    if metric == 'hops':
+        return yen_paths(csr, source, target, max_k,
+                         lambda root, banned_links: spur_path(csr, root[-1], target, set(root[:-1]), banned_links))
+    costs = csr.arc_costs(metric).tolist()
+    return yen_paths(csr, source, target, max_k,
+                     lambda root, banned_links: weighted_spur_path(csr, root[-1], target, costs, set(root[:-1]),
+                                                                   banned_links), costs)
+
+
+# the loop of Yen's algorithm, spur_search(path_root, banned_links) gives the shortest path (and its arcs) from
+# the last node of the root to the target, avoiding other nodes of the root and banned links
+# cost of a path is the sum of costs of its arcs (list indexed by arc id), number of arcs without them
+def yen_paths(csr, source, target, max_k, spur_search, costs=None):
+    path, arcs = spur_search([source], set())
+    if not path:
+        return [{'cost': float('inf'), 'path': [], 'arcs': []}]
+
+    def cost_of(arcs):
+        return len(arcs) if costs is None else sum(costs[arc] for arc in arcs)
 
-    if not A[0]['path']:
-        return A
+    # Shortest path from the source to the target
+    A = [{'cost': cost_of(arcs), 'path': path, 'arcs': arcs}]
+    link_of = csr.lists()[3]
+    # heap of potential k-th shortest paths and set of all paths found so far, so no path is added twice
+    B = []
+    seen = {tuple(path)}
+    counter = 0
 
     for _ in range(1, max_k):
+        last = A[-1]
         # The spur node ranges from the first node to the next to last node in the shortest path
-        for i in range(0, len(A[-1]['path']) - 1):
-            # Spur node is retrieved from the previous k-shortest path
-            node_spur = A[-1]['path'][i]
+        for i in range(len(last['path']) - 1):
             # The sequence of nodes from the source to the spur node of the previous k-shortest path
-            path_root = A[-1]['path'][:i + 1]
-
-            # We store the removed edges
-            edges_removed = []
-            for path_k in A:
-                curr_path = path_k['path']
-                if len(curr_path) > i and path_root == curr_path[:i + 1]:
-                    # Remove the links that are part of the previous shortest paths which share the same root path
-                    edge = curr_path[i].find_edge(curr_path[i + 1])
-                    curr_path[i].remove_edge(edge)
-                    curr_path[i + 1].remove_edge(edge)
-                    edges_removed.append([curr_path[i], curr_path[i + 1], 1])
-
-                # Calculate the spur path from the spur node to the sink
-            _, path_spur = dijkstra_get_path(node_spur, node_end, vertices)
-
+            path_root = last['path'][:i + 1]
+            # Links that are part of the previous shortest paths which share the same root path are banned,
+            # nodes of the root path (except spur node) too, so the paths stay loopless
+            banned_links = set(link_of[path_k['arcs'][i]] for path_k in A
+                               if len(path_k['path']) > i + 1 and path_k['path'][:i + 1] == path_root)
+
+            # Calculate the spur path from the spur node to the sink
+            path_spur, arcs_spur = spur_search(path_root, banned_links)
             if path_spur:
                 # Entire path is made up of the root path and spur path
                 path_total = path_root[:-1] + path_spur
-                dist_total = path_cost(_, path_total)
-                potential_k = {'cost': dist_total, 'path': path_total}
-                # Add the potential k-shortest path to the heap
-                B.put(Prioritize(potential_k['cost'], potential_k))
-
-            # Add back the edges that were removed from the graph
-            for edge in edges_removed:
-                edge[0].add_edge(edge[1])
-                edge[1].add_edge(edge[0])
-
-            # The lowest cost path becomes the k-shortest path.
-        while True and not B.empty():
-            path_ = B.get().object
-            if path_ not in A:
-                # We found a new path to add
-                A.append(path_)
-                break
+                key = tuple(path_total)
+                if key not in seen:
+                    seen.add(key)
+                    arcs_total = last['arcs'][:i] + arcs_spur
+                    counter += 1
+                    # Add the potential k-shortest path to the heap
+                    heapq.heappush(B, (cost_of(arcs_total), counter, path_total, arcs_total))
+
+        if not B:
+            break
+        # The lowest cost path becomes the k-shortest path.
+        cost, _, path, arcs = heapq.heappop(B)
+        A.append({'cost': cost, 'path': path, 'arcs': arcs})
     return A
 
 
-def path_cost(_, path):
+# BFS tree from the source over the CSR graph, optionally without banned nodes and links (numpy bool masks),
+# returns hop counts and the arc used to reach each node (-1 for the source and unreachable nodes)
+def bfs_tree(csr, source, banned_nodes=None, banned_links=None):
+    dist = np.full(csr.num_nodes, -1, dtype=np.int32)
+    previous_arc = np.full(csr.num_nodes, -1, dtype=np.int64)
+    dist[source] = 0
+    frontier = np.array([source])
+    level = 0
+    while len(frontier):
+        level += 1
+        arcs = csr.arcs_of(frontier)
+        targets = csr.targets[arcs]
+        keep = dist[targets] < 0
+        if banned_nodes is not None:
+            keep &= ~banned_nodes[targets]
+        if banned_links is not None:
+            keep &= ~banned_links[csr.link_of[arcs]]
+        dist[targets[keep]] = level
+        previous_arc[targets[keep]] = arcs[keep]
+        frontier = np.flatnonzero(dist == level)
+    return dist, previous_arc
+
+
+# k shortest paths from one source to many targets (dict target -> list of paths like ksp_yen_csr)
+# Links banned by Yen's algorithm all leave the spur node, so the spur path is an allowed first hop followed by
+# the shortest path to the target. Those we take from the BFS tree of the target (computed once, without bans),
+# when the tree path avoids the root, it is the shortest spur path, only otherwise we run the BFS with bans.
+# Trees of the targets can be passed in, so they are shared by calls for many sources.
+def ksp_from_source(csr, source, targets, max_k, trees=None):
+    trees = {} if trees is None else trees
+    offsets, sources, targets_list, link_of = csr.lists()
+    reverse = csr.reverse.tolist()
+
+    result = {}
+    for target in targets:
+        if target not in trees:
+            dist, previous_arc = bfs_tree(csr, target)
+            trees[target] = (dist.tolist(), previous_arc.tolist())
+        dist, previous_arc = trees[target]
+
+        def spur_search(path_root, banned_links):
+            spur = path_root[-1]
+            if spur == target:
+                return [spur], []
+            banned_nodes = set(path_root)
+            # allowed first hops, ordered by their distance to the target
+            hops = sorted((dist[targets_list[arc]], arc) for arc in range(offsets[spur], offsets[spur + 1])
+                          if dist[targets_list[arc]] >= 0 and targets_list[arc] not in banned_nodes and
+                          link_of[arc] not in banned_links)
+            for hop_dist, arc in hops:
+                if hop_dist > hops[0][0]:
+                    break
+                # path from the hop to the target goes up the tree of the target
+                arcs = [arc]
+                node = targets_list[arc]
+                while node != target and node not in banned_nodes:
+                    arcs.append(reverse[previous_arc[node]])
+                    node = targets_list[arcs[-1]]
+                if node == target:
+                    return [spur] + [targets_list[arc] for arc in arcs], arcs
+            if not hops:
+                return [], []
+            return spur_path(csr, spur, target, banned_nodes - {spur}, banned_links)
+
+        result[target] = yen_paths(csr, source, target, max_k, spur_search)
+    return result
+
+
+# Yen's algorithm for Node objects, it works on the CSR view of vertices, so the graph is not modified
+def ksp_yen(vertices, node_start, node_end, max_k, metric='hops'):
+    csr = CSRGraph(vertices)
+    A = ksp_yen_csr(csr, csr.index[node_start], csr.index[node_end], max_k, metric)
+    return [{'cost': path_k['cost'], 'path': csr.to_nodes(path_k['path'])} for path_k in A]
+
+
+# cost of the path (list of nodes) by the metric, sum of costs of the edges between consecutive nodes
+def path_cost(_, path, metric='hops'):
+    if metric == 'hops':
+        # just count the number of edges
+        return max(len(path) - 1, 0)
     cost_of_path = 0
-    for i in range(len(path)):
-        if i > 0:
-            # just count the number of edges
-            cost_of_path += 1
+    for i in range(1, len(path)):
+        edge = path[i - 1].find_edge(path[i])
+        cost_of_path += link_cost(edge.capacity, edge.latency, metric)
     return cost_of_path
 
 # endregion
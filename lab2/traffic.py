@@ -0,0 +1,96 @@
+# This code is part of the Advanced Computer Networks course at Vrije
+# Universiteit Amsterdam.
+
+# Licensed under the Apache License, Version 2.0 (the "License"); you may not
+# use this file except in compliance with the License. You may obtain a copy
+# of the License at
+
+#   http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+# Server level traffic matrices. A traffic matrix is a pair of int32 arrays (src, dst) of server indices (in order
+# of topology.servers), flow i goes from src[i] to dst[i]. Patterns are generated with numpy in time linear in the
+# number of flows and the same seed always gives the same matrix. Server flows are mapped to switch pairs with
+# server_switches of the topology (topology.server_switches() or store.server_switches(arrays)).
+
+import numpy as np
+
+PATTERNS = ('permutation', 'all_to_all', 'stride', 'hotspot')
+
+
+# random permutation traffic - every server sends to exactly one other server and receives from exactly one
+def random_permutation(num_servers, seed=None):
+    if num_servers < 2:
+        raise ValueError('permutation traffic needs at least 2 servers')
+    rng = np.random.default_rng(seed)
+    dst = rng.permutation(num_servers).astype(np.int32)
+    # servers sending to themselves exchange their destinations among each other, a single one with random server
+    fixed = np.flatnonzero(dst == np.arange(num_servers))
+    if len(fixed) > 1:
+        dst[fixed] = np.roll(dst[fixed], 1)
+    elif len(fixed) == 1:
+        other = (fixed[0] + rng.integers(1, num_servers)) % num_servers
+        dst[fixed[0]], dst[other] = dst[other], dst[fixed[0]]
+    return np.arange(num_servers, dtype=np.int32), dst
+
+
+# all-to-all traffic - a flow between every ordered pair of different servers (num_servers * (num_servers - 1) flows)
+def all_to_all(num_servers):
+    src, dst = np.divmod(np.arange(num_servers * num_servers, dtype=np.int64), num_servers)
+    keep = src != dst
+    return src[keep].astype(np.int32), dst[keep].astype(np.int32)
+
+
+# stride traffic - server i sends to server (i + stride) mod num_servers
+def stride(num_servers, stride=1):
+    if stride % num_servers == 0:
+        raise ValueError('stride must not be a multiple of the number of servers')
+    src = np.arange(num_servers, dtype=np.int32)
+    return src, ((src.astype(np.int64) + stride) % num_servers).astype(np.int32)
+
+
+# hotspot traffic - num_hotspots random servers are hot, every other server sends to one of them (picked at random)
+# with probability fraction and to a random other server otherwise, hot servers send to random servers
+def hotspot(num_servers, num_hotspots=1, fraction=0.5, seed=None):
+    if not 0 < num_hotspots < num_servers:
+        raise ValueError('number of hotspots must be between 1 and the number of servers - 1')
+    rng = np.random.default_rng(seed)
+    hot = rng.choice(num_servers, num_hotspots, replace=False)
+    src = np.arange(num_servers, dtype=np.int32)
+    # random other server: shift by 1..n-1, so the destination is never the source
+    dst = (src + rng.integers(1, num_servers, num_servers)) % num_servers
+    to_hot = rng.random(num_servers) < fraction
+    to_hot[hot] = False
+    dst[to_hot] = hot[rng.integers(0, num_hotspots, np.count_nonzero(to_hot))]
+    return src, dst.astype(np.int32)
+
+
+# traffic matrix by pattern name, options are passed to the pattern (e.g. stride=4 or num_hotspots=2)
+def generate(pattern, num_servers, seed=None, **options):
+    if pattern == 'permutation':
+        return random_permutation(num_servers, seed)
+    if pattern == 'all_to_all':
+        return all_to_all(num_servers)
+    if pattern == 'stride':
+        return stride(num_servers, **options)
+    if pattern == 'hotspot':
+        return hotspot(num_servers, seed=seed, **options)
+    raise ValueError('unknown traffic pattern: ' + str(pattern))
+
+
+# switch pairs of the flows, server_switches[s] is the switch of server s
+# flows between servers of the same switch do not use any switch links, so they are dropped
+def switch_pairs(src, dst, server_switches):
+    pairs = np.stack((server_switches[src], server_switches[dst]), axis=1)
+    return pairs[pairs[:, 0] != pairs[:, 1]]
+
+
+# distinct switch pairs (sorted by source and target) and number of flows between each of them
+def switch_demands(src, dst, server_switches):
+    pairs, counts = np.unique(switch_pairs(src, dst, server_switches), axis=0, return_counts=True)
+    return pairs.astype(np.int32), counts
@@ -17,6 +17,7 @@
 
 import os
 import subprocess
+import sys
 import time
 
 import mininet
@@ -32,6 +33,11 @@ from mininet.util import waitListening, custom
 import topo
 
 
+# bw and delay of the mininet TCLink from capacity (Mbit/s) and latency (ms) of the edge
+def link_options(edge):
+    return {'bw': edge.capacity, 'delay': '%gms' % edge.latency}
+
+
 class FattreeNet(Topo):
     """
     Create a fat-tree network in Mininet
@@ -76,7 +82,7 @@ class FattreeNet(Topo):
                 switch_idx = lower_pod_switches.index(switch)
                 self.addLink(net_lower_pod_switches[switch_idx],
                              net_servers[server_idx],
-                             bw=15, delay='5ms')
+                             **link_options(edge))
                 linked_edges.append(edge)
 
         # creating links upper layer and lower layer
@@ -88,7 +94,7 @@ class FattreeNet(Topo):
                     lower_switch_idx = lower_pod_switches.index(lower_switch)
                     self.addLink(net_upper_pod_switches[upper_switch_idx],
                                  net_lower_pod_switches[lower_switch_idx],
-                                 bw=15, delay='5ms')
+                                 **link_options(edge))
 
         # creating links between core layer and upper layer
         for core_switch in core_switches:
@@ -98,12 +104,12 @@ class FattreeNet(Topo):
                 pod_switch_idx = upper_pod_switches.index(pod_switch)
                 self.addLink(net_core_switches[core_switch_idx],
                              net_upper_pod_switches[pod_switch_idx],
-                             bw=15, delay='5ms')
+                             **link_options(edge))
                 
 
 def make_mininet_instance(graph_topo):
     net_topo = FattreeNet(graph_topo)
-    net = Mininet(topo=net_topo, controller=None, autoSetMacs=True)
+    net = Mininet(topo=net_topo, controller=None, autoSetMacs=True, link=TCLink)
     net.addController('c0', controller=RemoteController, ip="127.0.0.1", port=6653)
     return net
 
@@ -122,6 +128,7 @@ def run(graph_topo):
     net.stop()
 
 
-ft_topo = topo.Fattree(4)
+# optional JSON link profile (capacity and latency by kind of link) as the first argument
+ft_topo = topo.Fattree(4, topo.load_profile(sys.argv[1]) if len(sys.argv) > 1 else None)
 
 run(ft_topo)
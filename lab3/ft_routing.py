@@ -41,53 +41,50 @@ class FTRouter(app_manager.RyuApp):
         super(FTRouter, self).__init__(*args, **kwargs)
         self.topo_net = topo.Fattree(4)
 
+        # routing tables of the switches by their packed address, entries are (prefix, prefix length in bits) -> port
+        # the /0 entry holds the suffix table (suffix, suffix length in bits) -> port, all addresses are packed ints
         self.routing_table = {}
+        # switches by their dpid number
+        self.dpid_switches = {int(s.dpid[1:]): s for s in self.topo_net.switches}
 
         k = self.topo_net.num_ports
+        host_address = self.topo_net.get_host_id
 
         # lower pod switches
         for pod_num in range(0, k):
             for switch_no in range(0, int(k / 2)):
-                ip = '10.' + str(pod_num) + '.' + str(switch_no) + '.1'
-                self.routing_table.setdefault(ip, {})
+                table = self.routing_table.setdefault(self.topo_net.get_pod_switch_id(pod_num, switch_no), {})
 
                 for host in range(2, int(k / 2) + 2):
-                    mask = '10.' + str(pod_num) + '.' + str(switch_no) + '.' + str(host) + '/32'
-                    self.routing_table[ip][mask] = host - 1
+                    table[(host_address(pod_num, switch_no, host), 32)] = host - 1
 
-                self.routing_table[ip].setdefault('0.0.0.0/0', {})
+                suffixes = table.setdefault((0, 0), {})
 
                 for host in range(2, int(k / 2) + 2):
-                    mask = '0.0.0.' + str(host) + '/8'
                     port = int(((host - 2 + switch_no) % int(k / 2)) + int(k / 2)) + 1
-                    self.routing_table[ip]['0.0.0.0/0'][mask] = port
+                    suffixes[(host, 8)] = port
 
         # upper pod switches
         for pod_num in range(0, k):
             for switch_no in range(int(k / 2), k):
-                ip = '10.' + str(pod_num) + '.' + str(switch_no) + '.1'
-                self.routing_table.setdefault(ip, {})
+                table = self.routing_table.setdefault(self.topo_net.get_pod_switch_id(pod_num, switch_no), {})
 
                 for subnet_no in range(0, int(k / 2)):
-                    mask = '10.' + str(pod_num) + '.' + str(subnet_no) + '.0/24'
-                    self.routing_table[ip][mask] = subnet_no + 1
+                    table[(host_address(pod_num, subnet_no, 0), 24)] = subnet_no + 1
 
-                self.routing_table[ip].setdefault('0.0.0.0/0', {})
+                suffixes = table.setdefault((0, 0), {})
 
                 for host in range(2, int(k / 2) + 2):
-                    mask = '0.0.0.' + str(host) + '/8'
                     port = int(((host - 2 + switch_no) % int(k / 2)) + int(k / 2)) + 1
-                    self.routing_table[ip]['0.0.0.0/0'][mask] = port
+                    suffixes[(host, 8)] = port
 
         # core switches
         for j in range(1, int(k / 2) + 1):
             for i in range(1, int(k / 2) + 1):
-                ip = '10.' + str(k) + '.' + str(j) + '.' + str(i)
-                self.routing_table.setdefault(ip, {})
+                table = self.routing_table.setdefault(self.topo_net.get_core_switch_id(j, i, k), {})
 
                 for dest_pod in range(0, k):
-                    mask = '10.' + str(dest_pod) + '.0.0/16'
-                    self.routing_table[ip][mask] = dest_pod + 1
+                    table[(host_address(dest_pod, 0, 0), 16)] = dest_pod + 1
 
     # Topology discovery
     @set_ev_cls(event.EventSwitchEnter)
@@ -159,23 +156,20 @@ class FTRouter(app_manager.RyuApp):
         else:
             return
 
-        switch = next(s for s in self.topo_net.switches if (s.dpid[1:] == str(dpid)))
+        switch = self.dpid_switches[dpid]
+        dst_address = topo.ip_to_int(dst_ip)
         out_port = None
 
-        for prefix, port_value in self.routing_table[switch.id].items():
-            how_many_matching_bits = int(int(prefix.split('/')[1]) / 8)
-            prefix = prefix.split('/')[0]
-
-            if how_many_matching_bits == 0:
-                for suffix, port in port_value.items():
-                    how_many_matching_bits = int(int(suffix.split('/')[1]) / 8)
-                    suffix = suffix.split('/')[0]
-
-                    if dst_ip.split('.')[-how_many_matching_bits:] == suffix.split('.')[-how_many_matching_bits:]:
+        # the longer prefixes come first, the /0 entry goes to the suffix table
+        for (prefix, length), port_value in self.routing_table[switch.address].items():
+            if length == 0:
+                for (suffix, suffix_length), port in port_value.items():
+                    if topo.suffix_match(dst_address, suffix, suffix_length):
                         out_port = port
                         break
+                break
 
-            if dst_ip.split('.')[:how_many_matching_bits] == prefix.split('.')[:how_many_matching_bits]:
+            if topo.prefix_match(dst_address, prefix, length):
                 out_port = port_value
                 break
 
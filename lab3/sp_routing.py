@@ -50,7 +50,8 @@ class SPRouter(app_manager.RyuApp):
             part_distance, part_path = topo.dijkstra(start_host, self.topo_net.switches + self.topo_net.servers)
             for end_host in part_distance:
                 if end_host.type == 'h' and start_host != end_host:
-                    self.shortest_paths[(start_host.id, end_host.id)] = topo.get_path_dpid(part_path, start_host, end_host)
+                    self.shortest_paths[(start_host.address, end_host.address)] = \
+                        topo.get_path_dpid(part_path, start_host, end_host)
 
 
     # Topology discovery
@@ -76,7 +77,7 @@ class SPRouter(app_manager.RyuApp):
 
         link_port = {link.dst.dpid: link.src.port_no for link in self.topo_raw_links if link.src.dpid == dpid}
         
-        path = self.shortest_paths[(src_ip, dst_ip)][1:]
+        path = self.shortest_paths[(topo.ip_to_int(src_ip), topo.ip_to_int(dst_ip))][1:]
 
         for i, switch in enumerate(path):
             if switch == dpid:
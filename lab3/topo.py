@@ -15,16 +15,54 @@
 
 import random
 import queue
+import json
 import matplotlib.pyplot as plt
 import math
 
 
 # region Edge
-# Class for an edge in the graph
+# default link parameters: capacity in Mbit/s and latency in ms (bw and delay of the mininet TCLink)
+DEFAULT_CAPACITY = 15.0
+DEFAULT_LATENCY = 5.0
+
+
+# cost of the link for the metric - 'hops', 'latency' or 'capacity' (default capacity over capacity of the link,
+# like OSPF cost, so faster links are cheaper)
+def link_cost(edge, metric='hops'):
+    if metric == 'hops':
+        return 1
+    if metric == 'latency':
+        return edge.latency
+    if metric == 'capacity':
+        return DEFAULT_CAPACITY / edge.capacity
+    raise ValueError('unknown metric: ' + str(metric))
+
+
+# Link profile gives parameters of links by their kind - types of the two nodes in sorted order joined by '-',
+# e.g. {'h-p_sw': {'capacity': 10, 'latency': 0.5}, 'c_sw-p_sw': {'capacity': 40}}, kinds and values that are
+# missing get the defaults. Generators set capacity and latency of every link they create from the profile.
+def link_parameters(profile, node1, node2):
+    entry = (profile or {}).get('-'.join(sorted((node1.type, node2.type))), {})
+    return float(entry.get('capacity', DEFAULT_CAPACITY)), float(entry.get('latency', DEFAULT_LATENCY))
+
+
+# link profile from a JSON file with the dict described above
+def load_profile(filename):
+    with open(filename) as file:
+        return json.load(file)
+
+
+# Class for an edge in the graph, with capacity and latency of the link
 class Edge:
-    def __init__(self):
+    def __init__(self, capacity=DEFAULT_CAPACITY, latency=DEFAULT_LATENCY):
         self.lnode = None
         self.rnode = None
+        self.capacity = capacity
+        self.latency = latency
+
+    # the endpoint of the edge on the other side than node
+    def other(self, node):
+        return self.rnode if self.lnode is node else self.lnode
 
     def remove(self):
         self.lnode.edges.remove(self)
@@ -36,17 +74,45 @@ class Edge:
 # endregion
 
 # region Node
+# dotted ip address 'a.b.c.d' packed into one integer and back
+def ip_to_int(ip):
+    a, b, c, d = ip.split('.')
+    return (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+
+
+def int_to_ip(address):
+    return '%d.%d.%d.%d' % (address >> 24, (address >> 16) & 255, (address >> 8) & 255, address & 255)
+
+
+# does the address match prefix (packed) of the given length in bits
+def prefix_match(address, prefix, length):
+    return length == 0 or (address ^ prefix) >> (32 - length) == 0
+
+
+# does the address match suffix (packed) of the given length in bits
+def suffix_match(address, suffix, length):
+    return (address ^ suffix) & ((1 << length) - 1) == 0
+
+
 # Class for a node in the graph
+# fattree nodes have packed ip address (address) and the dotted string (id) is made only when it is read,
+# for other nodes address is None and id is stored as given
 class Node:
-    def __init__(self, id, type, dpid=None):
+    def __init__(self, id, type, dpid=None, dotted=False):
         self.edges = []
-        self.id = id
+        self.address = id if dotted else None
+        if not dotted:
+            self._id = id
         self.dpid = dpid
         self.type = type
 
+    @property
+    def id(self):
+        return int_to_ip(self.address) if self.address is not None else self._id
+
     # Add an edge connected to another node
-    def add_edge(self, node):
-        edge = Edge()
+    def add_edge(self, node, capacity=DEFAULT_CAPACITY, latency=DEFAULT_LATENCY):
+        edge = Edge(capacity, latency)
         edge.lnode = self
         edge.rnode = node
         self.edges.append(edge)
@@ -76,10 +142,12 @@ class Node:
 # region Jellyfish
 class Jellyfish:
 
-    def __init__(self, num_servers, num_switches, num_ports):
+    # profile gives capacity and latency of links by their kind ('h-sw' and 'sw-sw'), see link_parameters
+    def __init__(self, num_servers, num_switches, num_ports, profile=None):
         self.servers = []
         self.switches = []
         self.num_ports = num_ports
+        self.profile = profile
         self.generate(num_servers, num_switches)
 
     # function creating jellyfish topology following the paper
@@ -100,7 +168,7 @@ class Jellyfish:
             host = Node(i, 'h')
             # Connecting each server to one switch evenly
             switch = switches[i % num_switches]
-            host.add_edge(switch)
+            host.add_edge(switch, *link_parameters(self.profile, host, switch))
             # Server was connected to switch, so we decrease number of open ports on switch
             open_ports[i % num_switches] -= 1
             servers.append(host)
@@ -119,7 +187,7 @@ class Jellyfish:
             if open_ports[pair[0]] > 0 and open_ports[pair[1]] > 0:
                 sw1 = switches[pair[0]]
                 sw2 = switches[pair[1]]
-                sw1.add_edge(sw2)
+                sw1.add_edge(sw2, *link_parameters(self.profile, sw1, sw2))
                 # Storing created link
                 links.append((pair[0], pair[1]))
                 links.append((pair[1], pair[0]))
@@ -159,8 +227,8 @@ class Jellyfish:
                     links.remove((pair_idx_1, pair_idx_2))
                     links.remove((pair_idx_2, pair_idx_1))
 
-                    sw1.add_edge(switch3)
-                    sw2.add_edge(switch3)
+                    sw1.add_edge(switch3, *link_parameters(self.profile, sw1, switch3))
+                    sw2.add_edge(switch3, *link_parameters(self.profile, sw2, switch3))
                     links.append((pair_idx_1, idx))
                     links.append((idx, pair_idx_1))
                     links.append((pair_idx_2, idx))
@@ -254,10 +322,13 @@ class Jellyfish:
 # region Fattree
 class Fattree:
 
-    def __init__(self, num_ports):
+    # profile gives capacity and latency of links by their kind ('h-p_sw', 'p_sw-p_sw' and 'c_sw-p_sw'),
+    # see link_parameters
+    def __init__(self, num_ports, profile=None):
         self.servers = []
         self.switches = []
         self.num_ports = num_ports
+        self.profile = profile
         self.generate()
 
     # function creating fattree topology
@@ -268,7 +339,8 @@ class Fattree:
         core_layer_switches = []
         for i in range(1, int(self.num_ports / 2 + 1)):
             for j in range(1, int(self.num_ports / 2 + 1)):
-                core_switch = Node(self.get_core_switch_id(i, j, self.num_ports), 'c_sw', 's' + str(dpid_maker))
+                core_switch = Node(self.get_core_switch_id(i, j, self.num_ports), 'c_sw', 's' + str(dpid_maker),
+                                   dotted=True)
                 core_layer_switches.append(core_switch)
                 dpid_maker = dpid_maker + 1
 
@@ -279,20 +351,20 @@ class Fattree:
 
             # creation of lower layer switches
             for i in range(int(self.num_ports / 2)):
-                switch = Node(self.get_pod_switch_id(pod_num, i), 'p_sw', 's' + str(dpid_maker))
+                switch = Node(self.get_pod_switch_id(pod_num, i), 'p_sw', 's' + str(dpid_maker), dotted=True)
                 lower_layer_switches.append(switch)
                 dpid_maker = dpid_maker + 1
 
             # for each lower layer switch we create the hosts and connect them
             for i, switch in enumerate(lower_layer_switches):
                 for j in range(2, int(self.num_ports / 2 + 2)):
-                    host = Node(self.get_host_id(pod_num, i, j), 'h')
-                    switch.add_edge(host)
+                    host = Node(self.get_host_id(pod_num, i, j), 'h', dotted=True)
+                    switch.add_edge(host, *link_parameters(self.profile, switch, host))
                     self.servers.append(host)
 
             # creating upper layer switches
             for i in range(int(self.num_ports / 2), self.num_ports):
-                switch = Node(self.get_pod_switch_id(pod_num, i), 'p_sw', 's' + str(dpid_maker))
+                switch = Node(self.get_pod_switch_id(pod_num, i), 'p_sw', 's' + str(dpid_maker), dotted=True)
                 upper_layer_switches.append(switch)
                 dpid_maker = dpid_maker + 1
 
@@ -301,30 +373,32 @@ class Fattree:
                 # we calculate stride_num which indicate to which upper layer switch we connect the core switch
                 # stride_num is based on floor division - property of addressing in fattree
                 stride_num = int(i // (self.num_ports / 2))
-                core_layer_switches[i].add_edge(upper_layer_switches[stride_num])
+                core_switch = core_layer_switches[i]
+                core_switch.add_edge(upper_layer_switches[stride_num],
+                                     *link_parameters(self.profile, core_switch, upper_layer_switches[stride_num]))
 
             # connecting switches in pod
             for upper in upper_layer_switches:
                 for lower in lower_layer_switches:
-                    upper.add_edge(lower)
+                    upper.add_edge(lower, *link_parameters(self.profile, upper, lower))
 
             self.switches.extend(lower_layer_switches)
             self.switches.extend(upper_layer_switches)
 
         self.switches.extend(core_layer_switches)
 
-    # 3 utility functions for proper addressing of the nodes
+    # 3 utility functions for proper addressing of the nodes, addresses are packed into integers
     @staticmethod
     def get_pod_switch_id(pod_num, switch_num):
-        return '10.' + str(pod_num) + '.' + str(switch_num) + '.1'
+        return (10 << 24) | (pod_num << 16) | (switch_num << 8) | 1
 
     @staticmethod
     def get_core_switch_id(core_x, core_y, num_ports):
-        return '10.' + str(num_ports) + '.' + str(core_x) + '.' + str(core_y)
+        return (10 << 24) | (num_ports << 16) | (core_x << 8) | core_y
 
     @staticmethod
     def get_host_id(pod_num, switch_num, host_num):
-        return '10.' + str(pod_num) + '.' + str(switch_num) + '.' + str(host_num)
+        return (10 << 24) | (pod_num << 16) | (switch_num << 8) | host_num
 
     # func for plotting fattree topo
     def plot(self, save=False):
@@ -447,7 +521,8 @@ class Prioritize(object):
 # region Dijkstra
 
 # implementation of dijkstra algorithm, from starting node to every other in graph
-def dijkstra(start_vertex, vertices):
+# costs of the links are given by the metric - 'hops', 'latency' or 'capacity' (see link_cost)
+def dijkstra(start_vertex, vertices, metric='hops'):
     # sets for saving the results
     # result - for costs of paths to each node
     # previous - for previous step - used later for reproducing paths
@@ -459,8 +534,8 @@ def dijkstra(start_vertex, vertices):
         result[switch] = float('inf')
     # distance to where we are is 0
     result[start_vertex] = 0
-    # list to store already visited nodes
-    visited = []
+    # set to store already visited nodes
+    visited = set()
 
     # we initialize the priority queue, used to put possible paths from current node
     p_queue = queue.PriorityQueue()
@@ -470,12 +545,14 @@ def dijkstra(start_vertex, vertices):
     while not p_queue.empty():
         # we get next hop from queue and mark it as visited
         current_vertex = p_queue.get().object
-        visited.append(current_vertex)
-
-        for neighbor in vertices:
-            if current_vertex.is_neighbor(neighbor):
-                # we do not have weights (or path bandwidth) so we set 1 as cost of reaching next hop
-                distance = 1
+        visited.add(current_vertex)
+
+        for edge in current_vertex.edges:
+            neighbor = edge.other(current_vertex)
+            # nodes outside of vertices are skipped
+            if neighbor in result:
+                # cost of reaching next hop over this link
+                distance = link_cost(edge, metric)
                 # for each of reachable nodes, if one hasn't been visited yet we go there
                 if neighbor not in visited:
                     old_cost = result[neighbor]
@@ -541,8 +618,8 @@ def get_dpid_from_str(node):
 
 
 # utility function for getting the path between two nodes, it executes the dijkstra algorithm
-def dijkstra_get_path(start_vertex, end_node, vertices):
-    distance, previous = dijkstra(start_vertex, vertices)
+def dijkstra_get_path(start_vertex, end_node, vertices, metric='hops'):
+    distance, previous = dijkstra(start_vertex, vertices, metric)
 
     # it is possible that path between two nodes does not exist!
     if distance[end_node] == float('inf'):
@@ -563,8 +640,9 @@ def dijkstra_get_path(start_vertex, end_node, vertices):
 # endregion
 
 # region Yen
-def ksp_yen(vertices, node_start, node_end, max_k):
-    distances, previous = dijkstra(node_start, vertices)
+# k shortest paths by the metric (see link_cost)
+def ksp_yen(vertices, node_start, node_end, max_k, metric='hops'):
+    distances, previous = dijkstra(node_start, vertices, metric)
 
     # Shortest path from the source to the target
     A = [{'cost': distances[node_end],
@@ -590,25 +668,27 @@ def ksp_yen(vertices, node_start, node_end, max_k):
                 if len(curr_path) > i and path_root == curr_path[:i + 1]:
                     # Remove the links that are part of the previous shortest paths which share the same root path
                     edge = curr_path[i].find_edge(curr_path[i + 1])
-                    curr_path[i].remove_edge(edge)
-                    curr_path[i + 1].remove_edge(edge)
-                    edges_removed.append([curr_path[i], curr_path[i + 1], 1])
+                    # the link can be shared by several of the paths and already removed
+                    if edge is not None:
+                        curr_path[i].remove_edge(edge)
+                        curr_path[i + 1].remove_edge(edge)
+                        edges_removed.append(edge)
 
                 # Calculate the spur path from the spur node to the sink
-            _, path_spur = dijkstra_get_path(node_spur, node_end, vertices)
+            _, path_spur = dijkstra_get_path(node_spur, node_end, vertices, metric)
 
             if path_spur:
                 # Entire path is made up of the root path and spur path
                 path_total = path_root[:-1] + path_spur
-                dist_total = path_cost(_, path_total)
+                dist_total = path_cost(_, path_total, metric)
                 potential_k = {'cost': dist_total, 'path': path_total}
                 # Add the potential k-shortest path to the heap
                 B.put(Prioritize(potential_k['cost'], potential_k))
 
-            # Add back the edges that were removed from the graph
+            # Add back the edges that were removed from the graph (the same objects, so they keep their parameters)
             for edge in edges_removed:
-                edge[0].add_edge(edge[1])
-                edge[1].add_edge(edge[0])
+                edge.lnode.edges.append(edge)
+                edge.rnode.edges.append(edge)
 
             # The lowest cost path becomes the k-shortest path.
         while True and not B.empty():
@@ -620,12 +700,12 @@ def ksp_yen(vertices, node_start, node_end, max_k):
     return A
 
 
-def path_cost(_, path):
+# cost of the path (list of nodes) by the metric, sum of costs of the links between consecutive nodes
+def path_cost(_, path, metric='hops'):
     cost_of_path = 0
     for i in range(len(path)):
         if i > 0:
-            # just count the number of edges
-            cost_of_path += 1
+            cost_of_path += link_cost(path[i - 1].find_edge(path[i]), metric)
     return cost_of_path
 
 # endregion